@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# time each stage of the projection pipeline on a synthetic set of players, so that changes can be compared across commits.
+# the players are generated from the position models w/ a fixed seed, so no scraped data is needed.
+import argparse
+import json
+import logging
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from playermodels.positions import gen_player_model
+from get_fantasy_points import get_points_multi
+from ruleset import rulesets
+from run_projections import sim_quantiles, scoring_rng
+from tools import git_commit
+
+stages = ['replay', 'revert_evs', 'simulation', 'scoring', 'quantiles']
+
+def synthetic_players(pos, nplayers, nyears, seed):
+    """
+    a deterministic list of career stats for fake players, in the same form as get_player_stats.
+    each player's games are drawn from the starting position model with their own random stream.
+    """
+    pmod = gen_player_model(pos)
+    pdfs = []
+    for pseed in np.random.SeedSequence(seed).spawn(nplayers):
+        rng = np.random.default_rng(pseed)
+        pdf = pd.DataFrame(pmod.gen_games(16*nyears, rng=rng))
+        pdf['year'] = np.repeat(np.arange(2018-nyears, 2018), 16)
+        pdf['game_num'] = np.tile(np.arange(1, 17), nyears)
+        pdfs.append(pdf)
+    return pdfs
+
+
+class StageTimer:
+    """
+    accumulates the time (and optionally the peak traced memory) of each stage over all the players
+    """
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.times = dict.fromkeys(stages, 0.)
+        self.peaks = dict.fromkeys(stages, 0)
+
+    def run(self, stage, func, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.times[stage] += time.perf_counter() - start
+        if self.trace_memory:
+            self.peaks[stage] = max(self.peaks[stage], tracemalloc.get_traced_memory()[1])
+        return result
+
+
+def replay(pmod, pdf):
+    # the same loop as train_player, w/out the cache
+    for year in pdf['year'].unique():
+        if year != pdf['year'].iloc[0]:
+            pmod.new_season()
+        for _,game in pdf[pdf['year'] == year].iterrows():
+            pmod.update_game(game)
+    pmod.new_season()
+
+def bench_position(pos, pdfs, rules, nseasons, seed, timer):
+    """
+    run each stage for every player at a position.
+    returns the number of games processed by each stage.
+    """
+    ngames = dict.fromkeys(stages, 0)
+    pgames = 16
+    for pdf,pseed in zip(pdfs, np.random.SeedSequence(seed+1).spawn(len(pdfs))):
+        rng = np.random.default_rng(pseed)
+        pmod = gen_player_model(pos)
+        timer.run('replay', replay, pmod, pdf)
+        ngames['replay'] += len(pdf)
+
+        # pretend the experts expect the player's last season again
+        lastdf = pdf[pdf['year'] == pdf['year'].max()]
+        evs = {stat:lastdf[stat].mean() for stat in set(pmod.stats) & set(['pass_att', 'rush_att', 'targets'])}
+        timer.run('revert_evs', pmod.revert_evs, evs)
+
+        games = timer.run('simulation', pmod.gen_games, pgames*nseasons, rng=rng)
+        ngames['simulation'] += pgames*nseasons
+        fps = timer.run('scoring', get_points_multi, rules, games, rng=scoring_rng(pseed))
+        ngames['scoring'] += pgames*nseasons
+        timer.run('quantiles', np.quantile, fps, sim_quantiles, axis=0)
+        ngames['quantiles'] += pgames*nseasons
+    return ngames
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description='time the stages of the projection pipeline on synthetic players')
+    parser.add_argument('positions', type=str, nargs='*', default=['QB', 'RB', 'WR', 'TE'], help='which positions to run')
+    parser.add_argument('--players', type=int, default=32, help='number of synthetic players per position')
+    parser.add_argument('--years', type=int, default=4, help='number of seasons in each synthetic career')
+    parser.add_argument('--n-seasons', type=int, default=128, help='number of seasons to simulate for each player')
+    parser.add_argument('--ruleset', type=str, nargs='+', choices=list(rulesets), default=list(rulesets),
+                        help='which rulesets to score with')
+    parser.add_argument('--seed', type=int, default=3490, help='seed for the synthetic players and the simulations')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also find the peak memory allocated in each stage. this slows everything down, so the times are not comparable.')
+    parser.add_argument('--output', type=str, default=None, help='file to write the json results to (stdout if not given)')
+    args = parser.parse_args()
+
+    rules = [rulesets[rsname] for rsname in args.ruleset]
+    timer = StageTimer(args.trace_memory)
+    if args.trace_memory:
+        tracemalloc.start()
+
+    results = {'positions': {}}
+    for pos in args.positions:
+        pdfs = synthetic_players(pos, args.players, args.years, args.seed)
+        timer.times = dict.fromkeys(stages, 0.)
+        timer.peaks = dict.fromkeys(stages, 0)
+        ngames = bench_position(pos, pdfs, rules, args.n_seasons, args.seed, timer)
+        posres = {}
+        for stage in stages:
+            secs = timer.times[stage]
+            posres[stage] = {
+                'seconds': secs,
+                'games_per_sec': ngames[stage]/secs if ngames[stage] > 0 else None,
+                'players_per_sec': args.players/secs,
+            }
+            if args.trace_memory:
+                posres[stage]['peak_traced_bytes'] = timer.peaks[stage]
+        results['positions'][pos] = posres
+
+    # linux reports this in kilobytes, mac in bytes
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results['peak_rss_bytes'] = maxrss if sys.platform == 'darwin' else maxrss*1024
+    results['config'] = {
+        'players': args.players, 'years': args.years, 'n_seasons': args.n_seasons,
+        'rulesets': args.ruleset, 'seed': args.seed, 'trace_memory': args.trace_memory,
+    }
+    results['environment'] = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+    out = json.dumps(results, indent=2)
+    if args.output is None:
+        print(out)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+
+if __name__ == '__main__':
+    main()
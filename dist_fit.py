@@ -1,8 +1,7 @@
 import logging
 import numpy as np
 from numpy import sqrt, log, exp, pi
-from scipy.special import gammaln, betaln, beta, comb, digamma, gamma
-from scipy.misc import factorial
+from scipy.special import gammaln, betaln, comb, digamma, gamma
 import scipy.optimize as opt
 import scipy.stats as st
 import matplotlib.pyplot as plt
@@ -32,19 +31,19 @@ def neg_binomial( k, r, p ):
 
 def log_neg_binomial( k, r, p ):
     # return -gammaln( k+1 ) + gammaln( k + r ) - gammaln( r ) + k*log(p) + r*log(1-p)
-    karr = np.array(k) # make sure it's an array
-    result = np.array(karr*log(1-p) + r*log(p))
-    result[karr>0] += - log(karr) - betaln( karr, r )
-    result[karr<0] = -np.inf
-    return result
+    karr = np.asarray(k) # make sure it's an array
+    # the beta function term vanishes at k = 0. a safe value is used there so the whole array can be evaluated at once.
+    ksafe = np.where(karr > 0, karr, 1)
+    result = karr*log(1-p) + r*log(p) + np.where(karr > 0, - log(ksafe) - betaln( ksafe, r ), 0)
+    return np.where(karr < 0, -np.inf, result)
 
 # discrete in range 0,infinity
 # more variance than neg. bin.
 def beta_neg_binomial( k, r, a, b ):
-    return gamma(r+k)/(factorial(k) * gamma(r)) * beta(a+r,b+k) / beta(a,b)
+    return exp( log_beta_neg_binomial( k, r, a, b ) ) # this can avoid overflow
 
 def log_beta_neg_binomial( k, r, a, b ):
-    return gammaln(r+k) - gammaln(r) - log(factorial(k)) + betaln(a+r,b+k) - betaln(a,b)
+    return gammaln(r+k) - gammaln(r) - gammaln(k+1) + betaln(a+r,b+k) - betaln(a,b)
 
 # discrete in range [0,n]
 def beta_binomial( k, n, a, b ):
@@ -58,6 +57,19 @@ def log_beta_binomial( k, n, a, b ):
     # print(n,k)
     return log( comb(n,k) ) + betaln(k+a, n-k+b) - betaln(a,b)
 
+# gradients of the log pmfs w.r.t. the distribution parameters, for each point.
+# these are the summands of the grad_sum_* functions below.
+def grad_log_neg_binomial( k, r, p ):
+    dldr = digamma(k+r) - digamma(r) + log(p)
+    dldp = r/p - k/(1-p)
+    return np.array((dldr, dldp))
+
+def grad_log_beta_binomial( k, n, a, b ):
+    common = digamma(a+b) - digamma(n+a+b)
+    dlda = digamma(k+a) - digamma(a) + common
+    dldb = digamma(n-k+b) - digamma(b) + common
+    return np.array((dlda, dldb))
+
 # discrete (can be non-negative)
 def gaussian_int( bounds, k, mu, sigma ):
     c = 1.0/(2*sigma**2)
@@ -75,10 +87,37 @@ def exp_poly_ratio( bounds, k, pis, qis):
     return exp( - polyr(k) ) / norm_factor
 
 
-def sum_log_neg_binomial( ks, r, p ):
-    N = len( ks )
+# the likelihoods of the fits below only depend on the data through how many times each value occurs.
+# the sum_log_* functions take an optional array of counts for each of the ks, so that they can be evaluated on the
+# distinct values of a data set (see value_counts) and scale w/ the number of distinct values instead of the number of points.
+def value_counts( *data ):
+    """
+    the distinct values of the data and the number of times each occurs.
+    if more than one array is given (e.g. successes and trials), the distinct combinations are counted.
+    returns an array of the distinct values of each input, followed by an array of the counts.
+    """
+    arrs = [np.asarray(x, dtype=float).ravel() for x in data]
+    if len(arrs) == 1:
+        return np.unique(arrs[0], return_counts=True)
+    # a lexicographic sort is much quicker than np.unique w/ an axis, which sorts the rows as opaque records
+    order = np.lexsort(arrs[::-1])
+    arrs = [x[order] for x in arrs]
+    new = np.arange(len(order)) == 0
+    for x in arrs:
+        new[1:] |= np.diff(x) != 0
+    starts = np.flatnonzero(new)
+    counts = np.diff(np.append(starts, len(order)))
+    return tuple(x[starts] for x in arrs) + (counts,)
+
+def _counts( ks, counts ):
+    # each point is counted once if the counts aren't given
+    return np.ones(np.shape(ks)) if counts is None else np.asarray(counts, dtype=float)
+
+def sum_log_neg_binomial( ks, r, p, counts=None ):
+    counts = _counts( ks, counts )
+    N = np.sum( counts )
     # print(p) # we are getting 0 or 1 here for some data
-    return N*( r*log( p ) - gammaln( r ) ) + sum( gammaln( ks+r ) - gammaln( ks+1 ) + ks*log(1-p) )
+    return N*( r*log( p ) - gammaln( r ) ) + np.dot( counts, gammaln( ks+r ) - gammaln( ks+1 ) + ks*log(1-p) )
 
     # karr = np.array(k) # make sure it's an array
     # result = k*log(1-p) + r*log(p)
@@ -86,50 +125,57 @@ def sum_log_neg_binomial( ks, r, p ):
     # result[k<0] = -np.inf
     # return result
 
-def grad_sum_log_neg_binomial( ks, r, p ):
-    N = len( ks )
-    dldp =  N*r/p - sum( ks ) / (1-p)
-    dldr = N*(log(p) - digamma(r)) + sum( digamma(ks+r) )
+def grad_sum_log_neg_binomial( ks, r, p, counts=None ):
+    counts = _counts( ks, counts )
+    N = np.sum( counts )
+    dldp =  N*r/p - np.dot( counts, ks ) / (1-p)
+    dldr = N*(log(p) - digamma(r)) + np.dot( counts, digamma(ks+r) )
     return np.array((dldr, dldp))
 
-def sum_log_beta_neg_binomial( ks, r, a, b ):
-    N = len(ks)
+def sum_log_beta_neg_binomial( ks, r, a, b, counts=None ):
+    counts = _counts( ks, counts )
+    N = np.sum(counts)
     norm = N*(betaln(a,b) + gammaln(r))
-    terms = gammaln(r+ks) - log(factorial(ks)) + betaln(a+r,b+ks) 
-    return sum(terms) - norm
+    terms = gammaln(r+ks) - gammaln(ks+1) + betaln(a+r,b+ks)
+    return np.dot(counts, terms) - norm
 
-def grad_sum_log_beta_neg_binomial( ks, r, a, b):
-    N = len(ks)
+def grad_sum_log_beta_neg_binomial( ks, r, a, b, counts=None ):
+    counts = _counts( ks, counts )
+    N = np.sum(counts)
     dg_ar = digamma(a+r)
     dg_ab = digamma(a+b)
-    sum_dg_all = sum(digamma(a+r+b+ks))
-    dldr = sum(digamma(r+ks)) - N*digamma(r) + dg_ar - sum_dg_all
+    sum_dg_all = np.dot(counts, digamma(a+r+b+ks))
+    dldr = np.dot(counts, digamma(r+ks)) - N*digamma(r) + dg_ar - sum_dg_all
     dlda = N*(dg_ar + dg_ab - digamma(a)) - sum_dg_all
-    dldb = N*(dg_ab - digamma(b)) + sum(digamma(b+ks)) - sum_dg_all
+    dldb = N*(dg_ab - digamma(b)) + np.dot(counts, digamma(b+ks)) - sum_dg_all
     return np.array((dldr, dlda, dldb))
 
-# this does not account for the distribution of ns
-def sum_log_beta_binomial( ks, ns, a, b ):
+def _beta_binomial_weights( ns, counts ):
     # ns may or may not be variable
     # if n is variable, we should weight w.r.t. n
-    N = len(ks)
-    weights = np.full(shape=ks.shape, fill_value=1.0, dtype=float)
-    if np.shape(ns) != ():
-        weights = np.array(ns).astype(float)/np.mean(ns)
+    if np.shape(ns) == ():
+        return counts
+    ns = np.asarray(ns, dtype=float)
+    return counts * ns * np.sum(counts) / np.dot(counts, ns)
+
+# this does not account for the distribution of ns
+def sum_log_beta_binomial( ks, ns, a, b, counts=None ):
+    counts = _counts( ks, counts )
+    N = np.sum(counts)
+    weights = _beta_binomial_weights( ns, counts )
     # return -N * betaln(a,b) + sum( log(comb(ns,ks)) + betaln(ks+a, ns-ks+b) )
     # assert( a > 0 and b > 0) # why does this assertion fail for L-BFGS-B w/ gradient?
-    assert( (ns>0).all() )
-    result = -N * betaln(a,b) + sum( weights * (log(comb(ns,ks)) + betaln(ks+a, ns-ks+b)) )
+    assert( (np.asarray(ns)>0).all() )
+    result = -N * betaln(a,b) + np.dot( weights, log(comb(ns,ks)) + betaln(ks+a, ns-ks+b) )
     return result
 
-def grad_sum_log_beta_binomial( ks, ns, a, b ):
-    N = len(ks)
-    weights = np.full(shape=ks.shape, fill_value=1.0, dtype=float)
-    if np.shape(ns) != ():
-        weights = np.array(ns).astype(float)/np.mean(ns)
-    common = N*digamma(a+b) - sum(weights*digamma(ns+a+b))
-    dlda = sum(weights*digamma(ks+a)) - N*digamma(a) + common
-    dldb = sum(weights*digamma(ns-ks+b)) - N*digamma(b) + common
+def grad_sum_log_beta_binomial( ks, ns, a, b, counts=None ):
+    counts = _counts( ks, counts )
+    N = np.sum(counts)
+    weights = _beta_binomial_weights( ns, counts )
+    common = N*digamma(a+b) - np.dot(weights, np.broadcast_to(digamma(ns+a+b), np.shape(weights)))
+    dlda = np.dot(weights, digamma(ks+a)) - N*digamma(a) + common
+    dldb = np.dot(weights, digamma(ns-ks+b)) - N*digamma(b) + common
     # result = -N * betaln(a,b) + sum( weights* (log(comb(ns,ks)) + betaln(ks+a, ns-ks+b)) )
     # print( 'a, b, result, dlda, dldb = {}, {}, {}, {}, {}'.format( a, b, result, dlda, dldb))
     return np.array((dlda, dldb))
@@ -240,6 +286,7 @@ def to_neg_binomial( data ):
     n = len( arr_ks )
     mean = arr_ks.mean()
     var = arr_ks.var()
+    ks,counts = value_counts( arr_ks )
     p0 = mean/var
     r0 = mean**2/(var-mean) # initial guess. r > 0 and 0 < p < 1
     logging.info('r0,p0 = {:.3f}, {:.3f}'.format(r0,p0))
@@ -248,8 +295,8 @@ def to_neg_binomial( data ):
     # only LBFGS returns Hessian, in form of "LbjgsInvHessProduct"
     method = allowed_methods[0]
     
-    func = lambda pars: - sum_log_neg_binomial( arr_ks, *pars )
-    grad = lambda pars: - grad_sum_log_neg_binomial( arr_ks, *pars )
+    func = lambda pars: - sum_log_neg_binomial( ks, *pars, counts=counts )
+    grad = lambda pars: - grad_sum_log_neg_binomial( ks, *pars, counts=counts )
     opt_result = opt.minimize( func, (r0,p0), method=method, jac=grad, bounds=[(0,None),(0,1)] )
     isSuccess = opt_result.success
     if not isSuccess:
@@ -268,6 +315,7 @@ def to_beta_neg_binomial( data ):
     n = len( arr_ks )
     mean = arr_ks.mean()
     var = arr_ks.var()
+    ks,counts = value_counts( arr_ks )
     # p0 = mean/var # the EV for a/(a+b)
     a0,b0 = (mean, var-mean) # start w/ low variance. make sure a > 1
     r0 = mean*(a0-1)/b0 # initial guess for r,a,b # mean = r*b/(a-1) for a > 1
@@ -275,8 +323,8 @@ def to_beta_neg_binomial( data ):
     # only LBFGS returns Hessian, in form of "LbjgsInvHessProduct"
     method = allowed_methods[0]
     
-    func = lambda pars: - sum_log_beta_neg_binomial( arr_ks, *pars )
-    grad = lambda pars: - grad_sum_log_beta_neg_binomial( arr_ks, *pars )
+    func = lambda pars: - sum_log_beta_neg_binomial( ks, *pars, counts=counts )
+    grad = lambda pars: - grad_sum_log_beta_neg_binomial( ks, *pars, counts=counts )
     opt_result = opt.minimize( func, (r0,a0,b0), method=method, jac=grad, bounds=[(1e-6,None),(0,None),(0,None)],
                                options={'disp':False, # print convergence message
                                         'ftol':1e-12, # get better tolerance
@@ -298,17 +346,15 @@ def to_beta_binomial( ks, ns ):
     bounds = (0,n) where determines the (inclusive) domain
     ns may be variable
     """
-    if np.shape(ns) == ():
-        ns = np.full(shape=data.shape, fill_value=ns, dtype=float)
-    for x,n in zip(ks,ns):
-        if x < 0 or x > n:
-            logging.warning('data out of domain for beta-binomial')
     arr_ks = np.asarray(ks, dtype=float)
+    ns = np.broadcast_to(np.asarray(ns, dtype=float), arr_ks.shape)
+    if ((arr_ks < 0) | (arr_ks > ns)).any():
+        logging.warning('data out of domain for beta-binomial')
     N = len(arr_ks)
     # see "Further bayesian considerations" under beta-binomial wiki 
-    mu = sum( arr_ks ) / sum(ns)
+    mu = np.sum( arr_ks ) / np.sum(ns)
     # s2 = np.var( arr_ks/ns ) / N
-    s2 = sum( ns*(arr_ks/ns-mu)**2 ) / sum(ns) * 1.0/(1-1.0/N)
+    s2 = np.sum( ns*(arr_ks/ns-mu)**2 ) / np.sum(ns) * 1.0/(1-1.0/N)
     # M = ( mu*(1-mu) - s2 ) / ( s2 - mu*(1-mu)*np.mean(1.0/ns) )
     M = mu*(1-mu)/s2 - 1
     if M <= 0.0: # don't want this to be too small
@@ -324,8 +370,9 @@ def to_beta_binomial( ks, ns ):
     #     logging.warning('m1 = {}, m2 = {}, n = {}, N = {}'.format(m1, m2, n, N))
     allowed_methods = ['L-BFGS-B', 'TNC', 'SLSQP'] # these are the only ones that can handle bounds. they can also all handle jacobians. none of them can handle hessians.
     method = allowed_methods[0]
-    func = lambda pars: - sum_log_beta_binomial( arr_ks, ns, *pars )
-    grad = lambda pars: - grad_sum_log_beta_binomial( arr_ks, ns, *pars )
+    uks,uns,counts = value_counts( arr_ks, ns )
+    func = lambda pars: - sum_log_beta_binomial( uks, uns, *pars, counts=counts )
+    grad = lambda pars: - grad_sum_log_beta_binomial( uks, uns, *pars, counts=counts )
     minopts = {
         'maxcor':20, # maximum of variable metric corrections (default 10)
         'ftol':1e-12, # tolerance of objective function. (default ~2.22e-9)
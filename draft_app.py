@@ -1434,7 +1434,7 @@ def main():
     
     # decorate the dataframe with projections for our ruleset
     # use 15/16 for bye factor, since we're only considering 16 weeks of the season (w/ 1 bye)
-    availdf.loc[availdf.pos != 'DST', 'exp_proj'] = get_points(rules, availdf)
+    availdf.loc[availdf.pos != 'DST', 'exp_proj'] = get_points(rules, availdf, per_game=False)
     # for DST, just take the FP projection.
     availdf.loc[availdf.pos == 'DST', 'exp_proj'] = availdf['fp_projection']
     # can go ahead and filter out stats once we have projections
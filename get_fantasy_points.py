@@ -1,6 +1,8 @@
 
 # import ruleset
-# import pandas as pd
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 
 # doesn't cover every rule, just the main ones.
 # some stats are not as easily extracted
@@ -63,36 +65,167 @@ def getBasePoints( rs, plyr ):
 #     + rs.ppFG0 * df['kicking_fgm']
 #     return df
 
+# the stats that are scored, in the order of the compiled coefficients.
+# any that are missing from the data are taken to be zero.
+score_stats = [
+    'pass_att', 'pass_cmp', 'pass_yds', 'pass_td', 'pass_int', 'pass_twoptm',
+    'rush_yds', 'rush_td', 'rush_twoptm',
+    'rec', 'rec_yds', 'rec_td', 'rec_twoptm',
+    'fumbles_lost', 'xpm', 'fga', 'fgm',
+]
+# the terms that score per whole multiple of some yardage, which are not linear in the stats.
+# these come after the stats in the coefficient vector.
+floor_terms = [
+    ('pass_yds', 25, 'ppPY25'),
+    ('rush_yds', 10, 'ppRY10'),
+    ('rec_yds', 10, 'ppREY10'),
+]
+# single-game bonuses for yardage in [low, high). these come after the floor terms.
+# they only make sense for single games, not season totals.
+bonus_terms = [
+    ('pass_yds', 300, 400, 'ppP300'),
+    ('pass_yds', 400, np.inf, 'ppP400'),
+    ('rush_yds', 100, 200, 'ppRY100'),
+    ('rush_yds', 200, np.inf, 'ppRY200'),
+    ('rec_yds', 100, 200, 'ppREY100'),
+    ('rec_yds', 200, np.inf, 'ppREY200'),
+]
+# touchdowns of 40+ and 50+ yards, which come last. a 50+ yard TD gets both bonuses.
+# these are scored from e.g. pass_td40 and pass_td50 if the data has them.
+long_td_terms = [
+    ('pass_td', 40, 'ppPTD40'),
+    ('pass_td', 50, 'ppPTD50'),
+    ('rush_td', 40, 'ppRTD40'),
+    ('rush_td', 50, 'ppRTD50'),
+    ('rec_td', 40, 'ppRETD40'),
+    ('rec_td', 50, 'ppRETD50'),
+]
+# the fractions of TDs that are at least 40 and 50 yards, used when the data doesn't have pass_td40 etc.
+# the game logs we scrape from pro-football-reference only have TD counts, not their lengths, so these can't be fit here.
+# they are hand-set approximations of league-wide rates, not measurements, and should be replaced
+# if a source w/ the length of each TD (e.g. play-by-play data) is added.
+# rushing TDs are mostly from close to the goal line, so they are long less often than passing TDs.
+# every passing TD is also a receiving TD, so those two share the same rates.
+LONG_TD_FRACS = {
+    'pass_td': (0.12, 0.08),
+    'rush_td': (0.06, 0.04),
+    'rec_td': (0.12, 0.08),
+}
+
+@lru_cache(maxsize=None)
+def compile_ruleset( rs ):
+    """
+    the coefficients of a ruleset w.r.t. the scored terms (score_stats, floor_terms, bonus_terms, then long_td_terms),
+    so that points are a dot product.
+    rulesets are immutable so this only needs to be done once for each.
+    """
+    coefs = dict.fromkeys(score_stats, 0.)
+    coefs['pass_yds'] += rs.ppPY
+    coefs['pass_cmp'] += rs.ppPC - rs.ppINC
+    coefs['pass_att'] += rs.ppINC
+    coefs['pass_td'] += rs.ppPTD
+    coefs['pass_int'] += rs.ppINT
+    coefs['pass_twoptm'] += rs.pp2PC
+    coefs['rush_yds'] += rs.ppRY
+    coefs['rush_td'] += rs.ppRTD
+    coefs['rush_twoptm'] += rs.pp2PR
+    coefs['rec_yds'] += rs.ppREY
+    coefs['rec'] += rs.ppREC
+    coefs['rec_td'] += rs.ppRETD
+    coefs['rec_twoptm'] += rs.pp2PRE
+    coefs['fumbles_lost'] += rs.ppFUML
+    coefs['xpm'] += rs.ppPAT
+    coefs['fga'] += rs.ppFGM
+    coefs['fgm'] += rs.ppFG0 - rs.ppFGM
+    coefs = [coefs[stat] for stat in score_stats] \
+        + [getattr(rs, term[-1]) for term in floor_terms + bonus_terms + long_td_terms]
+    coefs = np.array(coefs, dtype=float)
+    coefs.setflags(write=False) # this is shared by every call
+    return coefs
+
+def _long_tds( df, stat, rng=None ):
+    """
+    the number of the TDs of a stat that are 40+ and 50+ yards.
+    these are taken from the data if it has them.
+    otherwise, each TD is randomly long w/ the rates in LONG_TD_FRACS if a random generator is given, or the expected numbers are used.
+    the generator should be separate from the one the games were simulated with, so that the games don't depend on the rulesets.
+    """
+    if stat+'40' in df and stat+'50' in df:
+        return np.asarray(df[stat+'40'], dtype=float), np.asarray(df[stat+'50'], dtype=float)
+    tds = np.asarray(df[stat], dtype=float)
+    frac40,frac50 = LONG_TD_FRACS[stat]
+    if rng is None:
+        return frac40*tds, frac50*tds
+    # thin the TDs down to the long ones, then the long ones down to the longer ones
+    td40 = rng.binomial(tds.astype(int), frac40).astype(float)
+    td50 = rng.binomial(td40.astype(int), frac50/frac40).astype(float)
+    return td40, td50
+
+def _score( df, coefs, rng=None, per_game=True ):
+    """
+    score the games in df with each row of coefs.
+    only the terms that are in the data and count for some ruleset are computed.
+    the terms are kept in rows so that each is contiguous, which is much faster to build for many games.
+    returns an array of points w/ the first axis over the rows of coefs.
+    """
+    used = (coefs != 0).any(axis=0)
+    cols,idxs = [],[]
+    def add(idx, col):
+        cols.append(col)
+        idxs.append(idx)
+    for i,stat in enumerate(score_stats):
+        if used[i] and stat in df:
+            add(i, np.asarray(df[stat], dtype=float))
+    offset = len(score_stats)
+    for i,(stat,div,_) in enumerate(floor_terms):
+        if used[offset+i] and stat in df:
+            add(offset+i, np.floor_divide(np.asarray(df[stat], dtype=float), div))
+    offset += len(floor_terms)
+    if per_game:
+        for i,(stat,low,high,_) in enumerate(bonus_terms):
+            if used[offset+i] and stat in df:
+                yds = np.asarray(df[stat], dtype=float)
+                add(offset+i, ((yds >= low) & (yds < high)).astype(float))
+    offset += len(bonus_terms)
+    for i in range(0, len(long_td_terms), 2):
+        stat = long_td_terms[i][0]
+        if (used[offset+i] or used[offset+i+1]) and stat in df:
+            td40,td50 = _long_tds(df, stat, rng)
+            add(offset+i, td40)
+            add(offset+i+1, td50)
+    if len(cols) == 0:
+        # nothing scores. the points still have the shape of the games (which is () for a single game's dict of values).
+        if isinstance(df, pd.DataFrame):
+            shape = (len(df),)
+        elif isinstance(df, dict) and len(df) > 0:
+            shape = np.broadcast_shapes(*(np.shape(vals) for vals in df.values()))
+        else:
+            shape = ()
+        return np.zeros((len(coefs),) + shape)
+    return coefs[:,idxs] @ np.stack(np.broadcast_arrays(*cols))
+
+def _as_points( pts, df ):
+    # keep the index when scoring a dataframe
+    if isinstance(df, pd.DataFrame):
+        return pd.Series(pts, index=df.index) if pts.ndim == 1 else pd.DataFrame(pts, index=df.index)
+    return pts[()] if np.ndim(pts) == 0 else pts
+
 # with get() this should work from a dictionary or a dataframe
-def get_points( rs, df ):
+def get_points( rs, df, rng=None, per_game=True ):
     """
-    repeating ourselves a lot here; it would be good to combine code w/ above (or only use this)
     rs: rule set
-    df: dataframe containing player stats
-    name: name of decorated stat
+    df: dataframe (or dictionary) containing player stats
+    rng: random generator to pick which TDs are long, if the data doesn't say. the expected number is used if None.
+    per_game: whether each row is a single game, so that the yardage bonuses apply (not for season totals)
+    returns the points of each game (a series for a dataframe, otherwise an array or a single value)
+    """
+    return _as_points(_score(df, compile_ruleset(rs)[np.newaxis], rng, per_game)[0], df)
+
+def get_points_multi( rss, df, rng=None, per_game=True ):
+    """
+    score the same games under several rulesets at once with a single matrix product.
+    the long TDs are drawn once, so each ruleset scores the same games.
+    returns the points w/ a column for each ruleset, in the order given.
     """
-    gf = lambda key: df.get(key, 0)
-    return \
-    rs.ppPY * gf('pass_yds') \
-    + rs.ppPY25 * (gf('pass_yds') // 25) \
-    + rs.ppPC * gf('pass_cmp') \
-    + rs.ppINC * (gf('pass_att') - gf('pass_cmp')) \
-    + rs.ppPTD * gf('pass_td') \
-    + rs.ppINT * gf('pass_int') \
-    + rs.pp2PC * gf('pass_twoptm') \
-    + rs.ppRY * gf('rush_yds') \
-    + rs.ppRY10 * (gf('rush_yds') // 10) \
-    + rs.ppRTD * gf('rush_td') \
-    + rs.pp2PR * gf('rush_twoptm') \
-    + rs.ppREY * gf('rec_yds') \
-    + rs.ppREY10 * (gf('rec_yds') // 10) \
-    + rs.ppREC * gf('rec') \
-    + rs.ppRETD * gf('rec_td') \
-    + rs.pp2PRE * gf('rec_twoptm') \
-    + rs.ppFUML * gf('fumbles_lost') \
-    + rs.ppPAT * gf('xpm') \
-    + rs.ppFGM * (gf('fga') - gf('fgm')) \
-    + rs.ppFG0 * gf('fgm')
-    # return df
-# could manually suffix these w/ "kick_". note that we can probably use more stats now (with PFR).
-# TODO: missing: missed PATs (ppPATM)
+    coefs = np.stack([compile_ruleset(rs) for rs in rss])
+    return _as_points(_score(df, coefs, rng, per_game).T, df)
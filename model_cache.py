@@ -0,0 +1,89 @@
+# save and load the states of trained player models, so that each run only has to learn from new games
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+
+cache_dir = 'data/model_cache'
+
+def file_hash(fname):
+    """
+    hash of the contents of a file, e.g. a player's stats
+    """
+    with open(fname, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def rows_hash(df, columns, nrows):
+    """
+    hash of the values of the first nrows rows in the given columns.
+    this checks that the games a saved model learned from are still the start of the player's history.
+    """
+    vals = np.ascontiguousarray(df[columns].iloc[:nrows].to_numpy(dtype=float))
+    return hashlib.sha1(vals.tobytes()).hexdigest()
+
+def hyperpar_hash(pmod):
+    """
+    hash of the member models and the hyperparameters they started with.
+    a saved state is only valid for the same hyperparameters.
+    """
+    h = hashlib.sha1()
+    for model in pmod.models:
+        h.update(type(model).__name__.encode())
+        h.update(np.asarray(model.hyperpars, dtype=float).tobytes())
+    # a model that learns the player's correlations has a different state
+    if pmod.player_corr is not None:
+        # the player's correlations decay between seasons at the rate of the stat models, which are hashed above.
+        # states saved before the unobserved stats were filled in are not valid either.
+        h.update('player_corr:{}:decay:observed'.format(pmod.corr_prior_games).encode())
+    return h.hexdigest()
+
+def rules_hash(rules):
+    return hashlib.sha1(repr(tuple(rules)).encode()).hexdigest()
+
+def _cache_file(pfr_id, pmod):
+    return os.path.join(cache_dir, '{}_{}.json'.format(pfr_id, hyperpar_hash(pmod)[:16]))
+
+def load_model_cache(pfr_id, pmod):
+    """
+    returns the saved entry for this player and model, or None if there isn't one.
+    the entry has the keys:
+      stats_hash: hash of the player's stats file when it was saved
+      ngames: number of rows of the stats that have been learned from
+      rows_hash: hash of those rows
+      year: the year of the last game learned from
+      state: the model state after the last game, before the decay at the end of the season
+      pcterrs: for each ruleset hash, a dictionary of the fractional errors of each year
+    """
+    fname = _cache_file(pfr_id, pmod)
+    if not os.path.isfile(fname):
+        return None
+    try:
+        with open(fname) as f:
+            entry = json.load(f)
+    except Exception as e:
+        logging.error('could not read {}: {}'.format(fname, e))
+        os.remove(fname)
+        return None
+    if entry.get('hyperpar_hash') != hyperpar_hash(pmod):
+        return None
+    return entry
+
+def save_model_cache(pfr_id, pmod, entry):
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = dict(entry, pfr_id=pfr_id, hyperpar_hash=hyperpar_hash(pmod))
+    entry['state'] = [np.asarray(mstate).tolist() for mstate in entry['state']]
+    fname = _cache_file(pfr_id, pmod)
+    # write to a temporary file first so that a crash can't leave a corrupted cache
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(entry, f)
+    os.replace(fname + '.tmp', fname)
+
+def model_is_current(pfr_id, pmod):
+    """
+    whether the saved model for this player has already learned from every game in their stats file
+    """
+    entry = load_model_cache(pfr_id, pmod)
+    if entry is None:
+        return False
+    return entry['stats_hash'] == file_hash('data/players/{}.csv'.format(pfr_id))
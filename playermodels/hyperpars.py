@@ -0,0 +1,72 @@
+# the registry of the hyperparameters of each stat model at each position.
+# the values are kept in hyperpars.json rather than in the code, so that retuning (see tune_hyperparameters.py)
+# only has to write a new version of the file. it is parsed once per process.
+from functools import lru_cache
+import json
+import logging
+import os
+import numpy as np
+
+registry_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hyperpars.json')
+
+@lru_cache(maxsize=None)
+def load_registry(fname=registry_file):
+    """
+    the contents of the registry: its version and a dictionary of model name to position to a list of hyperparameters.
+    the result is cached, so it should not be modified.
+    """
+    with open(fname) as f:
+        return json.load(f)
+
+def get_hyperpars(model_name, pos):
+    """
+    the hyperparameters of a stat model at a position, or None if there aren't any
+    """
+    hpars = load_registry()['models'].get(model_name, {}).get(pos.upper())
+    if hpars is None:
+        logging.error('no hyperparameters are saved for {} at {}'.format(model_name, pos))
+        return None
+    return np.array(hpars)
+
+def save_registry(models, fname=registry_file, **info):
+    """
+    write a new version of the registry w/ the given hyperparameters for each model and position.
+    models that aren't given keep their current values, and the previous version is kept alongside it as hyperpars_v<N>.json.
+    a new file starts from the current registry, so that it has every model that get_hyperpars needs.
+    nothing is written if none of the hyperparameters change.
+    info: anything else to record about this version (e.g. how it was tuned)
+    returns the new version, or None if nothing changed.
+    """
+    registry = {'version': 0, 'models': {}}
+    if os.path.isfile(fname):
+        with open(fname) as f:
+            registry = json.load(f)
+    elif os.path.isfile(registry_file):
+        with open(registry_file) as f:
+            registry = json.load(f)
+    changed = False
+    for model_name,poshpars in models.items():
+        saved = registry['models'].setdefault(model_name, {})
+        for pos,hpars in poshpars.items():
+            hpars = np.asarray(hpars, dtype=float).tolist()
+            if saved.get(pos) != hpars:
+                saved[pos] = hpars
+                changed = True
+    if not changed:
+        logging.info('none of the hyperparameters changed from version {}, so {} is not written.'.format(registry['version'], fname))
+        return None
+    if os.path.isfile(fname):
+        base,ext = os.path.splitext(fname)
+        os.replace(fname, '{}_v{}{}'.format(base, registry['version'], ext))
+    registry.update(info)
+    registry['version'] += 1
+    # one line per model and position keeps the file readable and the diffs between versions small
+    lines = []
+    for model_name,poshpars in registry['models'].items():
+        entries = ',\n'.join('   "{}": {}'.format(pos, json.dumps(hpars)) for pos,hpars in poshpars.items())
+        lines.append('  "{}": {{\n{}\n  }}'.format(model_name, entries))
+    others = ''.join(' {}: {},\n'.format(json.dumps(k), json.dumps(v)) for k,v in registry.items() if k != 'models')
+    with open(fname, 'w') as f:
+        f.write('{{\n{} "models": {{\n{}\n }}\n}}\n'.format(others, ',\n'.join(lines)))
+    load_registry.cache_clear()
+    return registry['version']
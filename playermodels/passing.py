@@ -1,6 +1,4 @@
 from playermodels.template import *
-import numpy as np
-import logging
 
 class PassAttModel(CountsModel):
     name = 'pass_att'
@@ -9,20 +7,6 @@ class PassAttModel(CountsModel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    @classmethod
-    def _default_hyperpars(self, pos):
-        pos = pos.upper()
-        if pos == 'QB':
-            return np.array((
-                0.816, 0.033, # bayes parameters
-                0.080, # learn rate
-                0.257,# season mem
-                0.857, # 0.05 # game mem
-            ))
-        else:
-            logging.error('no passing models for {}'.format(pos))
-        pass
-
 
 class PassCmpModel(TrialModel):
     name = 'pass_cmp'
@@ -31,18 +15,6 @@ class PassCmpModel(TrialModel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
     
-    @classmethod
-    def _default_hyperpars(self, pos):
-        pos = pos.upper()
-        if pos == 'QB':
-            return np.array((
-                64.38, 44.67, # initial bayes parameters
-                0.332, # learn rate
-                0.888, 0.964 # season,game memory
-            ))
-        else:
-            logging.error('only QBs have passing models (not {}s)'.format(pos))
-        pass
 
 class PassYdsModel(YdsPerAttModel):
     """
@@ -54,20 +26,6 @@ class PassYdsModel(YdsPerAttModel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    @classmethod
-    def _default_hyperpars(self, pos):
-        pos = pos.upper()
-        if pos == 'QB':
-            return np.array((
-                1.144, 0.0987, 1.075, 0.536, # initial bayes parameters
-                2.56, # skew
-                2.99e-4, 2.72e-6, # learn rates
-                0.709,0.865, # munu/nu, alpha/beta season memory
-                0.982,1.0, # game memories
-                ))
-        else:
-            logging.error('only QBs will have passing models (not {}s)'.format(pos))
-        pass
 
 class PassTdModel(TrialModel):
     name = 'pass_td'
@@ -76,18 +34,6 @@ class PassTdModel(TrialModel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
     
-    @classmethod
-    def _default_hyperpars(self, pos):
-        pos = pos.upper()
-        if pos == 'QB':
-            return np.array((
-                71.15, 962.47, # initial bayes parameters
-                1.0, # learn rate
-                0.905, 1.0 # season,game memory
-            ))
-        else:
-            logging.error('only QBs have passing models (not {}s)'.format(pos))
-        pass
 
 class PassIntModel(TrialModel):
     name = 'pass_int'
@@ -96,15 +42,3 @@ class PassIntModel(TrialModel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
     
-    @classmethod
-    def _default_hyperpars(self, pos):
-        pos = pos.upper()
-        if pos == 'QB':
-            return np.array((
-                6.02, 201.8, # initial bayes parameters
-                0.235, # learn rate
-                0.903, 0.995 # season,game memory
-            ))
-        else:
-            logging.error('only QBs have passing models (not {}s)'.format(pos))
-        pass
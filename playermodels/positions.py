@@ -28,7 +28,13 @@ def get_stat_model(mname):
         logging.error('could not provide model with name {}'.format(mname))
     else: return models[mname]
     
-def gen_player_model(pos):
+def gen_player_model(pos, hyperpars=None, corr_prior_games=None):
+    """
+    hyperpars: flat array of the hyperparameters of every stat model, as from PosModel.hyperpars().
+      this lets e.g. worker processes be sent the parameters directly. if None, they are read from the registry.
+    corr_prior_games: if provided, learn each player's own correlations, w/ the position's correlations
+      counting as this many games (see PlayerCorrelation). otherwise every player uses the position's.
+    """
     pm = {
         'QB': QbModel,
         'RB': RbModel,
@@ -37,46 +43,272 @@ def gen_player_model(pos):
         }
     if pos.upper() not in pm:
         logging.error('no model for position {}'.format(pos))
-    return pm[pos.upper()]()
+    return pm[pos.upper()](hyperpars, corr_prior_games)
+
+
+# correlations between the normal scores of each position's stats, in the order of the position model's members.
+# each is the spearman (rank) correlations between the model's cdf values for each training data point.
+# they can also be used as a prior for each player's own correlations, which are learned game by game (see PlayerCorrelation).
+# it might make sense to fix some of the off-diagonal terms to zero, but maybe moreso for other positions than QBs.
+QB_CORR = np.array(
+    [[ 1.   ,-0.099,-0.145,-0.232,-0.04 , 0.094, 0.172,-0.021],
+     [-0.099, 1.   ,-0.064, 0.096,-0.21 , 0.051,-0.125, 0.014],
+     [-0.145,-0.064, 1.   , 0.394,-0.033, 0.029,-0.064, 0.032],
+     [-0.232, 0.096, 0.394, 1.   ,-0.073, 0.015,-0.026,-0.087],
+     [-0.04 ,-0.21 ,-0.033,-0.073, 1.   ,-0.073, 0.053, 0.016],
+     [ 0.094, 0.051, 0.029, 0.015,-0.073, 1.   ,-0.002,-0.294],
+     [ 0.172,-0.125,-0.064,-0.026, 0.053,-0.002, 1.   , 0.068],
+     [-0.021, 0.014, 0.032,-0.087, 0.016,-0.294, 0.068, 1.   ]])
+# the RB correlation is computed weighting for rushing attempts, which makes the correlations smaller.
+RB_CORR = np.array(
+    [[ 1.   , 0.177,-0.09 , 0.099, 0.017, 0.026, 0.044],
+     [ 0.177, 1.   , 0.146,-0.048, 0.002, 0.032, 0.053],
+     [-0.09 , 0.146, 1.   ,-0.042, 0.034, 0.037,-0.002],
+     [ 0.099,-0.048,-0.042, 1.   ,-0.145, 0.07 ,-0.337],
+     [ 0.017, 0.002, 0.034,-0.145, 1.   , 0.075,-0.138],
+     [ 0.026, 0.032, 0.037, 0.07 , 0.075, 1.   , 0.055],
+     [ 0.044, 0.053,-0.002,-0.337,-0.138, 0.055, 1.   ]])
+WR_CORR = np.array(
+    [[ 1.   ,-0.081, 0.007,-0.199, 0.025,-0.009,-0.007],
+     [-0.081, 1.   , 0.059,-0.148, 0.009, 0.033,-0.05 ],
+     [ 0.007, 0.059, 1.   , 0.205,-0.008,-0.037, 0.078],
+     [-0.199,-0.148, 0.205, 1.   , 0.019, 0.001, 0.007],
+     [ 0.025, 0.009,-0.008, 0.019, 1.   , 0.113,-0.081],
+     [-0.009, 0.033,-0.037, 0.001, 0.113, 1.   , 0.053],
+     [-0.007,-0.05 , 0.078, 0.007,-0.081, 0.053, 1.   ]])
+TE_CORR = np.array(
+    [[ 1.   ,-0.111, 0.011,-0.184],
+     [-0.111, 1.   , 0.11 ,-0.133],
+     [ 0.011, 0.11 , 1.   , 0.027],
+     [-0.184,-0.133, 0.027, 1.   ]])
+
+# the lower-triangular cholesky factors only need to be computed once, at import.
+# correlated normals are then drawn as standard normals @ chol.T
+QB_CHOL = np.linalg.cholesky(QB_CORR)
+RB_CHOL = np.linalg.cholesky(RB_CORR)
+WR_CHOL = np.linalg.cholesky(WR_CORR)
+TE_CHOL = np.linalg.cholesky(TE_CORR)
+
+
+def _chol_rank_one_update(chol, x):
+    """
+    update the lower-triangular cholesky factor of a matrix A in place, so that it becomes the factor of A + x x^T.
+    this takes O(n^2) operations instead of the O(n^3) of factoring again.
+    """
+    x = np.array(x, dtype=float)
+    for k in range(len(x)):
+        r = np.hypot(chol[k,k], x[k])
+        c,s = r/chol[k,k], x[k]/chol[k,k]
+        chol[k,k] = r
+        chol[k+1:,k] = (chol[k+1:,k] + s*x[k+1:])/c
+        x[k+1:] = c*x[k+1:] - s*chol[k+1:,k]
+
+class PlayerCorrelation:
+    """
+    a shrinkage estimate of the correlations between the normal scores of a single player's stats.
+    the position's correlation matrix is a prior that counts as prior_games games, and each of the player's games
+    adds the outer product of its normal scores. the correlation matrix is this sum normalized to a unit diagonal.
+    only the cholesky factor of the sum is kept, and each game is a rank-one update of it.
+    stats w/out any information in a game are filled in from the current estimate given the ones that were observed
+    (w/ both their conditional mean and covariance), so the game doesn't pull their correlations toward zero.
+    between seasons the sum decays back toward the prior, so that older games count less than recent ones.
+    """
+    def __init__(self, corr, prior_games, season_mem):
+        """
+        season_mem: the fraction of the weight of the player's games that is kept at each new season
+        """
+        assert(prior_games > 0)
+        self.prior_factor = np.sqrt(prior_games)*np.linalg.cholesky(corr)
+        self.factor = self.prior_factor.copy()
+        self.season_mem = season_mem
+        self._chol = None
+
+    def update(self, scores, observed=None):
+        """
+        scores: the normal score of each stat in the game
+        observed: boolean mask of the stats that have information in the game (all of them if None)
+        """
+        scores = np.array(scores, dtype=float)
+        if observed is None or observed.all():
+            _chol_rank_one_update(self.factor, scores)
+            self._chol = None
+            return
+        if not observed.any():
+            return
+        obs,mis = np.flatnonzero(observed),np.flatnonzero(~observed)
+        corr = self.corr()
+        coefs = np.linalg.solve(corr[np.ix_(obs, obs)], corr[np.ix_(obs, mis)])
+        scores[mis] = coefs.T @ scores[obs]
+        condcov = corr[np.ix_(mis, mis)] - corr[np.ix_(mis, obs)] @ coefs
+        # the conditional covariance is added as a few more rank-one updates, from a square root of it.
+        # it can be singular, so the square root comes from its eigenvectors instead of a cholesky factor.
+        evals,evecs = np.linalg.eigh(condcov)
+        _chol_rank_one_update(self.factor, scores)
+        for col in (evecs*np.sqrt(np.clip(evals, 0, None))).T:
+            x = np.zeros(len(scores))
+            x[mis] = col
+            _chol_rank_one_update(self.factor, x)
+        self._chol = None
+
+    def new_season(self):
+        # this is the only time the sum is factored again, but it is small and it's only once a season
+        mem = self.season_mem
+        self.factor = np.linalg.cholesky(mem*(self.factor @ self.factor.T)
+                                         + (1-mem)*(self.prior_factor @ self.prior_factor.T))
+        self._chol = None
+
+    def chol(self):
+        """
+        the cholesky factor of the correlation matrix. it is saved until the next update.
+        """
+        if self._chol is None:
+            # the diagonal of the sum is the squared norm of each row of its factor.
+            # scaling the rows to unit norm normalizes the matrix while keeping the factor triangular.
+            self._chol = self.factor / np.linalg.norm(self.factor, axis=1)[:,np.newaxis]
+        return self._chol
+
+    def corr(self):
+        chol = self.chol()
+        return chol @ chol.T
+
+    def get_state(self):
+        return self.factor.copy()
+
+    def set_state(self, state):
+        self.factor = np.array(state, dtype=float)
+        self._chol = None
 
 
 class PosModel:
     """
     the position models are defined by the models for their stats and the covariance in each.
     most of the funcionatlity can be defined here.
+    the subclasses set the class attributes corr and chol, the correlation matrix and its cholesky factor,
+    and model_types, the types of the stat models.
     """
+    def __init__(self, hyperpars=None, corr_prior_games=None):
+        """
+        hyperpars: flat array of the hyperparameters of each stat model in turn (see hyperpars()).
+          if None, the ones saved for the position are used.
+        corr_prior_games: if provided, the player's correlations are learned from their games, starting from
+          the position's correlations w/ this weight in games.
+        """
+        self.corr_prior_games = corr_prior_games
+        if hyperpars is None:
+            self.models = tuple(mtype.for_position(self.pos) for mtype in self.model_types)
+        else:
+            nhpars = [len(mtype._hyperpar_bounds()) for mtype in self.model_types]
+            assert(len(hyperpars) == sum(nhpars))
+            hpsplit = np.split(np.asarray(hyperpars, dtype=float), np.cumsum(nhpars)[:-1])
+            self.models = tuple(mtype.for_position(self.pos, hpars) for mtype,hpars in zip(self.model_types, hpsplit))
+        self.player_corr = None
+        if corr_prior_games is not None:
+            # the correlations are forgotten between seasons at the average rate of the stat models
+            season_mem = np.mean(np.concatenate([np.ravel(model.season_mem) for model in self.models]))
+            self.player_corr = PlayerCorrelation(self.corr, corr_prior_games, season_mem)
+
+    def hyperpars(self):
+        """
+        the hyperparameters of all the stat models as a single flat array
+        """
+        return np.concatenate([model.hyperpars for model in self.models])
+
     @property
     def stats(self):
         return [model.name for model in self.models]
 
-    def gen_game(self):
+    def _cov_cholesky(self):
+        # lower-triangular factor of the covariance of the stats' normal scores
+        if self.player_corr is not None:
+            return self.player_corr.chol()
+        return self.chol
+
+    def _sobol_normals(self, n, rng=None):
+        """
+        correlated normals from scrambled sobol points instead of pseudo-random ones.
+        the low-discrepancy points cover the space of outcomes more evenly, so fewer games are needed for the same accuracy.
+        a new scramble is drawn from rng each call, so repeated calls give independent estimates.
+        """
+        sampler = st.qmc.Sobol(d=len(self.models), scramble=True, seed=rng)
+        # sobol points are balanced in powers of 2, so draw the next one up and keep the first n.
+        # they should never be exactly 0 or 1, but be safe.
+        eps = np.finfo(float).eps
+        unis = sampler.random_base2(int(np.ceil(np.log2(max(n, 1)))))[:n]
+        unis = np.clip(unis, eps, 1-eps)
+        return st.norm.ppf(unis) @ self._cov_cholesky().T
+
+    def gen_games(self, n, rng=None, qmc=False):
+        """
+        generate random statlines for n games at once.
+        returns a dictionary of arrays of length n, one for each stat.
+        rng: numpy random generator to draw from (a fresh unseeded one is used if None)
+        qmc: use quasi-monte carlo (scrambled sobol) points instead of pseudo-random ones
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        games = {}
+        # the generator should handle the correlations.
+        # all the correlated normals are drawn at once, then each member model's ppf is called on a whole column.
+        if qmc:
+            nrvs = self._sobol_normals(n, rng)
+        else:
+            nrvs = rng.standard_normal((n, len(self.models))) @ self._cov_cholesky().T
+        urvs = st.norm.cdf(nrvs)
+        for rv,model in zip(urvs.T, self.models):
+            depvars = [games[dv] for dv in model.dep_vars] # get previously generated stats needed for this one
+            games[model.pred_var] = model.ppf(*depvars, rv)
+        return games
+
+    def gen_game(self, rng=None):
         """
         generate a random statline for a single game
+        rng: numpy random generator to draw from, as in gen_games
         """
-        game = {}
-        # call the ppf of each member model
-        # the generator should handle the correlations
-        urvs = st.norm.cdf(self.stat_gen.rvs())
-        for rv,model in zip(urvs, self.models):
-            depvars = [game[dv] for dv in model.dep_vars] # get previously generated stats needed for this one
-            game[model.pred_var] = model.ppf(*depvars, rv)
-        return game
+        games = self.gen_games(1, rng)
+        return {stat:vals[0] for stat,vals in games.items()}
 
     def update_game(self, game):
         """
         update the stats based on the results of 1 game
         we can either do this stochastically using the KLD gradient and a variable learn rate, or using bayesian models
         """
+        if self.player_corr is not None:
+            # the scores must be found from the predictions before the models learn from the game
+            self.player_corr.update(*self._normal_scores(game))
         for model in self.models:
             stats = [game[v] for v in model.var_names]
             model.update_game(*stats)
 
+    def _normal_scores(self, game):
+        """
+        the normal score of each stat in a game, from where it fell in its model's predicted distribution.
+        returns the scores and a mask of the stats that were observed.
+        stats that depend on another that is zero (e.g. yards w/out any attempts) have no information and aren't observed.
+        neither are bad data points w/ more successes than attempts (e.g. receptions than targets), nor any that don't have a finite score.
+        """
+        eps = 1e-6
+        scores = np.zeros(len(self.models))
+        observed = np.zeros(len(self.models), dtype=bool)
+        for i,model in enumerate(self.models):
+            stats = [game[v] for v in model.var_names]
+            if any(dv == 0 for dv in stats[1:]):
+                continue
+            if isinstance(model, TrialModel) and stats[0] > stats[1]:
+                continue
+            score = st.norm.ppf(np.clip(model.mid_cdf(*stats), eps, 1-eps))
+            if np.isfinite(score):
+                scores[i] = score
+                observed[i] = True
+        return scores,observed
+
     def new_season(self):
         """
         decay some parameters to account for uncertainty between seasons
         """
         for model in self.models:
             model.new_season()
+        if self.player_corr is not None:
+            self.player_corr.new_season()
 
     def revert_evs(self, ev_dict):
         """
@@ -91,6 +323,22 @@ class PosModel:
             logging.error('Could not revert all evs:')
             logging.error(ev_dict)
 
+    def get_state(self):
+        """
+        the learned parameters of each member model, e.g. to save a trained model.
+        if the player's correlations are being learned, the factor of their estimate is last.
+        """
+        state = [model.get_state() for model in self.models]
+        if self.player_corr is not None:
+            state.append(self.player_corr.get_state())
+        return state
+
+    def set_state(self, state):
+        for model,mstate in zip(self.models, state):
+            model.set_state(mstate)
+        if self.player_corr is not None:
+            self.player_corr.set_state(state[len(self.models)])
+
     def evs(self):
         evs = {}
         for model in self.models:
@@ -108,101 +356,68 @@ class QbModel(PosModel):
     model for quarterbacks.
     passing and rushing.
     """
-    def __init__(self):
-        # these must be ordered such that stats come after those they depend on
-        self.models = (
-            PassAttModel.for_position('QB'),
-            PassCmpModel.for_position('QB'),
-            PassYdsModel.for_position('QB'),
-            PassTdModel.for_position('QB'),
-            PassIntModel.for_position('QB'),
-            RushAttModel.for_position('QB'),
-            RushYdsModel.for_position('QB'),
-            RushTdModel.for_position('QB'),
-        )
-        # it might make sense to fix some of the off-diagonal terms to zero, but maybe moreso for other positions than QBs.
-        self.stat_gen = st.multivariate_normal(
-            cov = [[ 1.   ,-0.099,-0.145,-0.232,-0.04 , 0.094, 0.172,-0.021],
-                   [-0.099, 1.   ,-0.064, 0.096,-0.21 , 0.051,-0.125, 0.014],
-                   [-0.145,-0.064, 1.   , 0.394,-0.033, 0.029,-0.064, 0.032],
-                   [-0.232, 0.096, 0.394, 1.   ,-0.073, 0.015,-0.026,-0.087],
-                   [-0.04 ,-0.21 ,-0.033,-0.073, 1.   ,-0.073, 0.053, 0.016],
-                   [ 0.094, 0.051, 0.029, 0.015,-0.073, 1.   ,-0.002,-0.294],
-                   [ 0.172,-0.125,-0.064,-0.026, 0.053,-0.002, 1.   , 0.068],
-                   [-0.021, 0.014, 0.032,-0.087, 0.016,-0.294, 0.068, 1.   ]]
-            )
+    corr = QB_CORR
+    chol = QB_CHOL
+    pos = 'QB'
+    # these must be ordered such that stats come after those they depend on
+    model_types = (
+        PassAttModel,
+        PassCmpModel,
+        PassYdsModel,
+        PassTdModel,
+        PassIntModel,
+        RushAttModel,
+        RushYdsModel,
+        RushTdModel,
+    )
 
 # we'll want to split this up into a few types
 class RbModel(PosModel):
     """
     represents a statistical model for a single season for a running back.
     """
-    def __init__(self):
-        # these must be ordered such that stats come after those they depend on
-        self.models = (
-            RushAttModel.for_position('RB'),
-            RushYdsModel.for_position('RB'),
-            RushTdModel.for_position('RB'),
-            RecTgtModel.for_position('RB'),
-            RecModel.for_position('RB'),
-            RecYdsModel.for_position('RB'),
-            RecTdModel.for_position('RB'),
-        )
-        # the order here is important: att, yds, tds
-        # the covariance matrix is the spearman (rank) correlations between
-        # the model's cdf values for each training data point.
-        # the correlation is computed weighting for rushing attempts, which makes the correlations smaller.
-        # in theory, this correlation matrix itself could be updated each season for each player individually.
-        self.stat_gen = st.multivariate_normal(
-            cov = [[ 1.   , 0.177,-0.09 , 0.099, 0.017, 0.026, 0.044],
-                   [ 0.177, 1.   , 0.146,-0.048, 0.002, 0.032, 0.053],
-                   [-0.09 , 0.146, 1.   ,-0.042, 0.034, 0.037,-0.002],
-                   [ 0.099,-0.048,-0.042, 1.   ,-0.145, 0.07 ,-0.337],
-                   [ 0.017, 0.002, 0.034,-0.145, 1.   , 0.075,-0.138],
-                   [ 0.026, 0.032, 0.037, 0.07 , 0.075, 1.   , 0.055],
-                   [ 0.044, 0.053,-0.002,-0.337,-0.138, 0.055, 1.   ]]
-        )
+    corr = RB_CORR
+    chol = RB_CHOL
+    pos = 'RB'
+    # these must be ordered such that stats come after those they depend on
+    model_types = (
+        RushAttModel,
+        RushYdsModel,
+        RushTdModel,
+        RecTgtModel,
+        RecModel,
+        RecYdsModel,
+        RecTdModel,
+    )
 
 class WrModel(PosModel):
     """
     represents the stats to track for wideouts
     """
-    
-    def __init__(self):
-        self.models = (
-            RecTgtModel.for_position('WR'),
-            RecModel.for_position('WR'),
-            RecYdsModel.for_position('WR'),
-            RecTdModel.for_position('WR'),
-            RushAttModel.for_position('WR'),
-            RushYdsModel.for_position('WR'),
-            RushTdModel.for_position('WR'),
-        )
-        self.stat_gen = st.multivariate_normal(
-            cov = [[ 1.   ,-0.081, 0.007,-0.199, 0.025,-0.009,-0.007],
-                    [-0.081, 1.   , 0.059,-0.148, 0.009, 0.033,-0.05 ],
-                    [ 0.007, 0.059, 1.   , 0.205,-0.008,-0.037, 0.078],
-                    [-0.199,-0.148, 0.205, 1.   , 0.019, 0.001, 0.007],
-                    [ 0.025, 0.009,-0.008, 0.019, 1.   , 0.113,-0.081],
-                    [-0.009, 0.033,-0.037, 0.001, 0.113, 1.   , 0.053],
-                    [-0.007,-0.05 , 0.078, 0.007,-0.081, 0.053, 1.   ]]
-        )
+    corr = WR_CORR
+    chol = WR_CHOL
+    pos = 'WR'
+    model_types = (
+        RecTgtModel,
+        RecModel,
+        RecYdsModel,
+        RecTdModel,
+        RushAttModel,
+        RushYdsModel,
+        RushTdModel,
+    )
 
 class TeModel(PosModel):
     """
     model for tight ends.
     only tracks receptions.
     """
-    def __init__(self):
-        self.models = (
-            RecTgtModel.for_position('TE'),
-            RecModel.for_position('TE'),
-            RecYdsModel.for_position('TE'),
-            RecTdModel.for_position('TE'),
-        )
-        self.stat_gen = st.multivariate_normal(
-            cov = [[ 1.   ,-0.111, 0.011,-0.184],
-                   [-0.111, 1.   , 0.11 ,-0.133],
-                   [ 0.011, 0.11 , 1.   , 0.027],
-                   [-0.184,-0.133, 0.027, 1.   ]]
-        )
+    corr = TE_CORR
+    chol = TE_CHOL
+    pos = 'TE'
+    model_types = (
+        RecTgtModel,
+        RecModel,
+        RecYdsModel,
+        RecTdModel,
+    )
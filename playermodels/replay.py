@@ -0,0 +1,118 @@
+# run a stat model through many players' careers at once.
+# the bayesian updates act on each player independently, so the state of every player can be kept in one array
+# w/ a trailing axis over players, and each game of the career is applied to all of them together.
+# this is much faster than looping over each player's games, e.g. when searching for hyperparameters.
+import numpy as np
+
+class Careers:
+    """
+    the games of many players' careers, padded into arrays w/ a row for each player and a column for each game.
+    """
+    def __init__(self, pdfs, var_names, max_game=None):
+        """
+        pdfs: list of dataframes of each player's games, sorted by year and game_num
+        var_names: the stats to keep. any that a player doesn't have are set to zero.
+        max_game: if provided, games w/ game_num >= max_game are left out (e.g. week 17 is often funky).
+          the seasons of these games still count for the decay between seasons.
+        """
+        self.var_names = list(var_names)
+        vdfs = [pdf[pdf['game_num'] < max_game] if max_game is not None else pdf for pdf in pdfs]
+        nplayers = len(pdfs)
+        ngames = max([len(vdf) for vdf in vdfs] + [0])
+        self.data = {var:np.zeros((nplayers, ngames)) for var in self.var_names}
+        self.mask = np.zeros((nplayers, ngames), dtype=bool)
+        # the number of new seasons before each game, and after the last one
+        self.ndecay = np.zeros((nplayers, ngames), dtype=int)
+        self.nfinal = np.zeros(nplayers, dtype=int)
+        for i,(pdf,vdf) in enumerate(zip(pdfs, vdfs)):
+            years = pdf['year'].unique()
+            assert((np.diff(years) > 0).all()) # make sure the years are sorted
+            n = len(vdf)
+            for var in self.var_names:
+                if var in vdf:
+                    self.data[var][i,:n] = vdf[var].values
+            self.mask[i,:n] = True
+            # a new season starts at the end of every year, whether or not any of its games are kept
+            iyears = np.searchsorted(years, vdf['year'].values)
+            self.ndecay[i,:n] = np.diff(iyears, prepend=0)
+            self.nfinal[i] = len(years) - (iyears[-1] if n > 0 else 0)
+
+    @property
+    def shape(self):
+        return self.mask.shape
+
+    def games(self, var_names=None):
+        """
+        the values of each game that was played, flattened in the same order as replay()'s history
+        """
+        var_names = self.var_names if var_names is None else var_names
+        return [self.data[var][self.mask] for var in var_names]
+
+
+def _new_seasons(model, state, ndecay, dstate=None):
+    # decay each player's state (and its tangent, if given) by their number of new seasons
+    for k in range(ndecay.max() if ndecay.size > 0 else 0):
+        model.set_state(state)
+        decay = ndecay > k
+        if dstate is not None:
+            dstate = np.where(decay, model.season_tangent(dstate), dstate)
+        model.new_season()
+        state = np.where(decay, model.get_state(), state)
+    return state, dstate
+
+def replay(model, careers, tangent=False):
+    """
+    run the model through every career, starting each player from the model's current state.
+    returns the history of states before each game, w/ shape (nparams, nplayers, ngames).
+    afterwards the model holds the final state of every player (after the last season ends), w/ shape (nparams, nplayers).
+    tangent: if True, the model must be in its initial state, and the history of the derivatives of the state w.r.t.
+      the hyperparameters is also returned, w/ shape (nparams, nhyperpars, nplayers, ngames).
+    """
+    nplayers,ngames = careers.shape
+    state = np.repeat(model.get_state()[:,np.newaxis], nplayers, axis=1)
+    history = np.empty(state.shape + (ngames,))
+    dstate,dhistory = None,None
+    if tangent:
+        dstate = np.repeat(model.init_tangent()[...,np.newaxis], nplayers, axis=-1)
+        dhistory = np.empty(dstate.shape + (ngames,))
+    for t in range(ngames):
+        state,dstate = _new_seasons(model, state, careers.ndecay[:,t], dstate)
+        history[...,t] = state
+        model.set_state(state)
+        games = [careers.data[var][:,t] for var in model.var_names]
+        played = careers.mask[:,t]
+        if tangent:
+            dhistory[...,t] = dstate
+            # padding after the end of a career doesn't change the tangent either
+            dstate = np.where(played, model.game_tangent(dstate, *games), dstate)
+        model.update_game(*games)
+        # padding after the end of a career doesn't change the state
+        state = np.where(played, model.get_state(), state)
+    state,dstate = _new_seasons(model, state, careers.nfinal, dstate)
+    model.set_state(state)
+    if tangent:
+        return history, dhistory
+    return history
+
+def total_kld(model, careers):
+    """
+    the total KLD of every game in every career, where each game is predicted before the model learns from it.
+    the model's state is left as the batch of every game's state.
+    """
+    history = replay(model, careers)
+    model.set_state(history[:,careers.mask])
+    return np.sum(model.kld(*careers.games(model.var_names)))
+
+def total_kld_grad(model, careers):
+    """
+    the total KLD as in total_kld(), along w/ its gradient w.r.t. the model's hyperparameters.
+    the derivatives are carried forward through the bayesian updates alongside the state.
+    """
+    if not hasattr(type(model), 'kld_grad'):
+        raise TypeError('{} does not support gradients w.r.t. its hyperparameters'.format(type(model).__name__))
+    history,dhistory = replay(model, careers, tangent=True)
+    model.set_state(history[:,careers.mask])
+    games = careers.games(model.var_names)
+    dkld,dkld_hyper = model.kld_grad(*games)
+    grad = np.einsum('sg,shg->h', dkld, dhistory[...,careers.mask]) + np.sum(dkld_hyper, axis=-1)
+    return np.sum(model.kld(*games)), grad
@@ -3,21 +3,107 @@ import numpy as np
 import scipy.stats as st
 # from scipy.special import gamma, digamma
 import dist_fit
+from playermodels.hyperpars import get_hyperpars
 import logging
 
+def _as_output(x):
+    """
+    unwrap 0-d arrays so that scalar inputs still give scalar outputs
+    """
+    return x[()] if np.ndim(x) == 0 else x
+
+def _per_state(hpars, nstate, ndim):
+    """
+    a hyperparameter (or one for each bayes parameter) shaped to broadcast along the first axis of an array w/ ndim dimensions
+    """
+    return np.reshape(np.broadcast_to(hpars, (nstate,)), (nstate,) + (1,)*(ndim-1))
+
 class Model:
     """
     base class w/ just a bit of common and default functionality
     """
     @classmethod
-    def for_position(self, pos):
-        return self(*self._default_hyperpars(pos))
+    def _default_hyperpars(self, pos):
+        # these are kept in the registry (hyperpars.json)
+        return get_hyperpars(self.name, pos)
+
+    @classmethod
+    def for_position(self, pos, hpars=None):
+        """
+        hpars: hyperparameters to use instead of the ones saved for the position
+        """
+        if hpars is None:
+            hpars = self._default_hyperpars(pos)
+        model = self(*hpars)
+        # remember what we started with, e.g. to tell if a saved state is still valid
+        model.hyperpars = np.array(hpars)
+        return model
+
+    def get_state(self):
+        """
+        the bayesian parameters that are learned from the data, as a flat array.
+        the state can also have a trailing axis over a batch of players (see replay.py),
+        in which case update_game and new_season act on each player at once.
+        """
+        return self.ab.copy()
+
+    def set_state(self, state):
+        self.ab = np.array(state, dtype=float)
 
     @property
     def var_names(self):
         var_names = [self.pred_var] + list(self.dep_vars)
         return var_names
 
+    # forward-mode derivatives of the state w.r.t. the hyperparameters (the constructor arguments),
+    # so that the hyperparameter search can be given the gradient of the total KLD.
+    # a tangent has shape (nstate, nhyperpars), plus the batch axis of the state if there is one.
+    # the subclasses set _lr_idx, _mem_idx, and _gmem_idx to the index of the hyperparameter that is the
+    # learn rate, season memory, and game memory of each bayes parameter, and define _game_obs() and kld_grad().
+    # kld_grad(*args) returns the gradient of kld(*args) for each game w.r.t. the state and w.r.t. any hyperparameters
+    # it uses directly, w/ shapes (nstate, ngames) and (nhyperpars, ngames).
+    # only CountsModel, TrialModel, and YdsPerAttModel support this; CountsModelMM does not.
+    def init_tangent(self):
+        """
+        the tangent of the initial state, which is just the first few hyperparameters
+        """
+        return np.eye(len(self.get_state()), len(self._hyperpar_bounds()))
+
+    def season_tangent(self, dstate):
+        """
+        the tangent after new_season(), given the one before. this must be called before new_season().
+        """
+        state = self.get_state()
+        nstate = len(state)
+        dstate = _per_state(self.season_mem, nstate, dstate.ndim) * dstate
+        dstate[np.arange(nstate), self._mem_idx] += state
+        return dstate
+
+    def game_tangent(self, dstate, *args):
+        """
+        the tangent after update_game(*args), given the one before. this must be called before update_game().
+        """
+        state = self.get_state()
+        nstate = len(state)
+        obs = self._game_obs(*args)
+        dstate_new = _per_state(self.game_mem, nstate, dstate.ndim) * dstate \
+            + _per_state(self.game_lr, nstate, dstate.ndim) * self._game_obs_tangent(dstate, *args)
+        dstate_new[np.arange(nstate), self._gmem_idx] += state
+        dstate_new[np.arange(nstate), self._lr_idx] += obs
+        return dstate_new
+
+    def _game_obs_tangent(self, dstate, *args):
+        # the tangent of _game_obs(), which usually doesn't depend on the state
+        return 0.
+
+    def mid_cdf(self, *args):
+        """
+        the cdf halfway through the probability of the value itself (i.e. P(< x) + P(x)/2).
+        for discrete stats this is centered, so the normal scores of a well-described stat have zero mean even
+        when most of the weight is on a single value like zero.
+        """
+        return 0.5*(self.cdf(*args) + self.cdf(np.asarray(args[0]) - 1, *args[1:]))
+
     def summary(self):
         args = [1 for _ in self.dep_vars] # assume everything is "per" something else, if anything
         return u'{}:    \t{:.3f} \u00B1 {:.3f}'.format(self.name, self.ev(*args), np.sqrt(self.var(*args)))
@@ -43,6 +129,8 @@ class CountsModel(Model):
         self.season_mem = mem
         self.game_mem = gmem
         # self.kldpen = kldp # ends up over-corrected to recent fluctuations
+        # cache of the cdf over the allowed support. it must be reset whenever ab changes.
+        self._cdf_tab = None
     
     @classmethod
     def _hyperpar_bounds(self):
@@ -53,7 +141,13 @@ class CountsModel(Model):
             (0.0, 1.0), # game memory 
             # (0.0, 1.0), # KLD penalty
         ]
+
+    _lr_idx, _mem_idx, _gmem_idx = (2,2), (3,3), (4,4)
     
+    def set_state(self, state):
+        super().set_state(state)
+        self._cdf_tab = None
+
     # a shortcut for a re-mapping of beta that comes up a lot due to the common convention for negative binomial
     def _p(self):
         # scipy convention for p (not wiki)
@@ -66,11 +160,16 @@ class CountsModel(Model):
         # it could be guaranteed with a game_mem < 1, but it's not obvious how to do this naively
         # we really want to use "chi-sq" but this isn't well-defined for the neg. bin. distribution
         self.ab *= self.game_mem
-        self.ab += self.game_lr * np.array((att, 1.))
+        self.ab += self.game_lr * self._game_obs(att)
+        self._cdf_tab = None
         # we could accumulate a KLD to diagnose when the model has been very off recently
 
+    def _game_obs(self, att):
+        return np.array((att, np.ones_like(att)))
+
     def new_season(self):
         self.ab *= self.season_mem
+        self._cdf_tab = None
 
     def revert_ev(self, newev):
         """
@@ -85,22 +184,37 @@ class CountsModel(Model):
             # we'll try increasing keeping the sum of alpha and beta constant
             c = self.ab.sum()
             self.ab = np.array((newev,1))*c/(1+newev)
-            
-    def ppf(self, uni):
-        # this yields a gamma convoluted w/ a poisson
+        self._cdf_tab = None
+
+    def _maxatt(self):
         # most rush attempts is 45, pass attempts is 70, and most targets is >= 18.
         # the fact that we have to do this is really ugly, so a next big step
         # might be modeling touches as percentages of game plays.
+        return 35 if self.name == 'rush_att' else \
+            65 if self.name == 'pass_att' else \
+            20 if self.name == 'targets' else 100
+
+    def _cdf_table(self):
+        """
+        the cdf at each point of the integer support, up to the maximum number of attempts.
+        the support is small, so this is computed once and saved until the bayes parameters change.
+        """
+        if self._cdf_tab is None:
+            self._cdf_tab = st.nbinom.cdf(np.arange(self._maxatt()+1), self.ab[0], self._p())
+        return self._cdf_tab
+            
+    def ppf(self, uni):
+        # this yields a gamma convoluted w/ a poisson
+        # uni can be an array, in which case an array of attempts is returned.
+        uni = np.asarray(uni, dtype=float)
         if self.ab[0] == 0:
             # this can happen if we revert the ev to zero
-            return 0
-        maxatt = 35 if self.name == 'rush_att' else \
-                 65 if self.name == 'pass_att' else \
-                 20 if self.name == 'targets' else 100
-        maxuni = self.cdf(maxatt) # maximum rush attempts ever was 45
-        uni *= maxuni
-        att = st.nbinom.ppf(uni, self.ab[0], self._p())
-        return att
+            return _as_output(np.zeros_like(uni))
+        cdf = self._cdf_table()
+        # the last entry is the cdf at the maximum number of attempts, which we rescale to.
+        # the result is then the first point in the support where the cdf reaches uni.
+        att = np.searchsorted(cdf, uni*cdf[-1]).astype(float)
+        return _as_output(att)
 
     def cdf(self, att):
         cdf = st.nbinom.cdf(att, self.ab[0], self._p())
@@ -121,6 +235,12 @@ class CountsModel(Model):
     def kld(self, att):
         return - st.nbinom.logpmf(att, self.ab[0], self._p())
 
+    def kld_grad(self, att):
+        dldr,dldp = dist_fit.grad_log_neg_binomial(att, self.ab[0], self._p())
+        # dp/dbeta = 1/(1+beta)^2
+        dkld = - np.array((dldr, dldp/(1.+self.ab[1])**2))
+        return dkld, np.zeros((len(self._hyperpar_bounds()),) + np.shape(att))
+
     def __str__(self):
         pars = u'\u03B1\t= {:.2f}\n\u03B2\t= {:.2f}\n'.format(*self.ab)
         pars += 'lr\t= {:.3f}\nmem\t= {:.3f}\ngmem\t= {:.3f}\n'.format(self.game_lr, self.season_mem, self.game_mem)
@@ -153,12 +273,17 @@ class TrialModel(Model):
             (0.2,1.0),(0.5,1.0),
         ]
 
+    _lr_idx, _mem_idx, _gmem_idx = (2,2), (3,3), (4,4)
+
     def _p(self):
-        return self.ab[0] / self.ab.sum()
+        return self.ab[0] / (self.ab[0] + self.ab[1])
         
     def update_game(self, succ, att):
         self.ab *= self.game_mem
-        self.ab += self.game_lr * np.array((succ, att - succ))
+        self.ab += self.game_lr * self._game_obs(succ, att)
+
+    def _game_obs(self, succ, att):
+        return np.array((succ, att - succ))
 
     def new_season(self):
         self.ab *= self.season_mem
@@ -172,25 +297,39 @@ class TrialModel(Model):
         var = att*a*b*(apb+att)/(apb**2*(apb+1))
         return var
 
+    def _pmf_table(self, att, kmax):
+        """
+        tabulate the pmf for 0 to kmax successes along a new last axis of att.
+        entries with more successes than attempts are zero.
+        """
+        ks = np.arange(kmax+1)
+        valid = ks <= att[...,None]
+        nsafe = np.where(valid, att[...,None], ks)
+        # a batch of states lines up w/ the batch of attempts
+        a,b = np.asarray(self.ab[0])[...,None], np.asarray(self.ab[1])[...,None]
+        pmf = dist_fit.beta_binomial(ks, nsafe, a, b)
+        return np.where(valid, pmf, 0.)
+
     def ppf(self, att, uni):
-        if att == 0: return 0
-        succ = 0
-        cdf = dist_fit.beta_binomial(0, att, *self.ab)
-        while cdf < uni:
-            succ += 1
-            cdf += dist_fit.beta_binomial(succ, att, *self.ab)
-        return succ
+        # att and uni can be arrays (of the same shape), e.g. for a batch of games.
+        att, uni = np.broadcast_arrays(np.asarray(att, dtype=float), np.asarray(uni, dtype=float))
+        # the result is the smallest number of successes whose cdf reaches uni, so it is
+        # just the count of points below uni. only k < att is checked so that rounding can't push us past att.
+        kmax = int(att.max()) if att.size > 0 else 0
+        ks = np.arange(kmax+1)
+        cdf = np.cumsum(self._pmf_table(att, kmax), axis=-1)
+        succ = ((ks < att[...,None]) & (cdf < uni[...,None])).sum(axis=-1)
+        return _as_output(succ)
     
     def cdf(self, succ, att):
         # CDF is the % of the mass that is *at or equal to* the value.
         # these CDFs will not be flat, since most results are 0 and that's most of the way up the CDF already
         # this is the definition we want, however, for analyzing the correlations
-        cdf = 0.
-        check = 0
-        while check <= succ:
-            cdf += dist_fit.beta_binomial(check, att, *self.ab)
-            check += 1
-        return cdf
+        succ, att = np.broadcast_arrays(np.asarray(succ, dtype=float), np.asarray(att, dtype=float))
+        kmax = int(succ.max()) if succ.size > 0 else 0
+        pmf = self._pmf_table(att, kmax)
+        cdf = np.where(np.arange(kmax+1) <= succ[...,None], pmf, 0.).sum(axis=-1)
+        return _as_output(cdf)
         
     def chi_sq(self, succ, att):
         # if att == 0: return 0.
@@ -198,9 +337,16 @@ class TrialModel(Model):
         return 2.*(self.kld(succ, att) + norm)
     
     def kld(self, succ, att):
-        if att == 0: return 0.
-        if succ > att: att = succ
-        return - dist_fit.log_beta_binomial( succ, att, *self.ab)
+        succ, att = np.asarray(succ, dtype=float), np.asarray(att, dtype=float)
+        # there is no information w/ zero attempts.
+        # if there are more successes than attempts (bad data), treat it as all successes.
+        kld = - dist_fit.log_beta_binomial( succ, np.maximum(succ, att), self.ab[0], self.ab[1])
+        return _as_output(np.where(att == 0, 0., kld))
+
+    def kld_grad(self, succ, att):
+        succ, att = np.asarray(succ, dtype=float), np.asarray(att, dtype=float)
+        dkld = - dist_fit.grad_log_beta_binomial(succ, np.maximum(succ, att), self.ab[0], self.ab[1])
+        return np.where(att == 0, 0., dkld), np.zeros((len(self._hyperpar_bounds()),) + np.shape(att))
 
     def __str__(self):
         pars = u'{:.2f}% rate\n\u03B1\t= {:.2f}\n\u03B2\t= {:.2f}\n'.format(100*self._p(), *self.ab)
@@ -246,20 +392,44 @@ class YdsPerAttModel(Model):
             (0.2,1.0),(0.4,1.0), # season memory
             (0.5,1.0),(0.5,1.0), # game memory - doesn't help much
         ]
+
+    _lr_idx, _mem_idx, _gmem_idx = (5,5,6,6), (7,7,8,8), (9,9,10,10)
         
+    def get_state(self):
+        return self.mnab.copy()
+
+    def set_state(self, state):
+        self.mnab = np.array(state, dtype=float)
+
+    def _per_par(self, hpars):
+        # hyperparameters for each of the bayes parameters, shaped to broadcast against a batch of states
+        return np.reshape(hpars, (-1,) + (1,)*(self.mnab.ndim-1))
+
     def update_game(self, yds, att):
         # assert((0 < self.game_mem).all() and (self.game_mem <= 1.0).all())
         # mu does not decay simply like the others, but mu*nu does
+        obs = self._game_obs(yds, att)
+        self.mnab *= self._per_par(self.game_mem)
+        self.mnab += self._per_par(self.game_lr) * obs
+        # we could accumulate a KLD to diagnose when the model has been very wrong recently
+
+    def _game_obs(self, yds, att):
         ev = self.ev(att)
-        self.mnab *= self.game_mem
-        self.mnab += self.game_lr * np.array((yds, att,
-                                              0.5*att,
-                                              0.5*(yds-ev)**2/max(1,att)))
         # the max() function is just to avoid a divide-by-zero error when everything is zero
-        # we could accumulate a KLD to diagnose when the model has been very wrong recently
+        return np.array((yds, att,
+                         0.5*att,
+                         0.5*(yds-ev)**2/np.maximum(1,att)))
+
+    def _game_obs_tangent(self, dstate, yds, att):
+        # the update to beta depends on the state through the expected yards
+        munu,nu = self.mnab[0],self.mnab[1]
+        dev = att*(dstate[0]/nu - munu*dstate[1]/nu**2)
+        dobs = np.zeros_like(dstate)
+        dobs[3] = -(yds-self.ev(att))/np.maximum(1,att) * dev
+        return dobs
 
     def new_season(self):
-        self.mnab *= self.season_mem
+        self.mnab *= self._per_par(self.season_mem)
 
     def _df(self, att):
         # we should probably use the # of attempts, but this choice can be overridden
@@ -273,13 +443,12 @@ class YdsPerAttModel(Model):
     def _ncmean(self, att):
         # the built-in mean function calls stats, which also computes variance and gives a warning for df = 2
         # ncmean = st.nct.mean(df, nc) if df > 1 else nc
-        df = self._df(att)
+        df = np.asarray(self._df(att), dtype=float)
         nc = self.skew
-        if df <= 1: return nc
         # ncmean = nc*np.sqrt(0.5*df)*gamma(0.5*(df-1))/gamma(0.5*df)
-        # a good approximation is:
-        ncmean = nc/(1 - 3/(4*df-1))
-        return ncmean
+        # a good approximation is below. it isn't valid for df <= 1, where we just use nc.
+        ncmean = np.where(df > 1, nc/(1 - 3/(4*np.maximum(df, 2.)-1)), nc)
+        return _as_output(ncmean)
 
     def _loc(self, att):
         df = self._df(att)
@@ -303,28 +472,31 @@ class YdsPerAttModel(Model):
 
     # given a uniformly distributed number 0 < uni < 1, return the yards corresponding to that point on the cdf.
     # correlations can be dealt with externally, since it's much easier to correlate normal variables.
+    # att and uni can also be arrays of the same shape, so that a batch of games is done in one call.
     def ppf(self, att, uni):
-        assert(0 < uni < 1)
-        if att == 0: return 0 # we won't try to simulate laterals
-        df,nc = att,self.skew
+        att, uni = np.broadcast_arrays(np.asarray(att, dtype=float), np.asarray(uni, dtype=float))
+        assert(((0 < uni) & (uni < 1)).all())
+        # we won't try to simulate laterals, so no attempts means no yards.
+        # those entries are evaluated w/ a placeholder of 1 attempt and masked out at the end.
+        played = att > 0
+        df,nc = np.where(played, att, 1.),self.skew
+        loc,scale = self._loc(df),self._scale(df)
         # constrain to make sure we don't roll ridiculous values
         # really, this is a hack and we need a better way to model yards / attempt,
         # e.g. rush-by-rush.
         # most rush yards is 295 by AP; most receiving is 336 by Willie Anderson
-        minuni = self.cdf(-5*att, att)
-        maxyds = 500 if self.name == 'pass_yds' else 250   
-        maxuni = self.cdf(min(50*att, maxyds), att)
-        uni *= (maxuni-minuni)
-        uni += minuni
-        ypa = st.nct.ppf(uni, df, nc,
-                         loc=self._loc(att),
-                         scale=self._scale(att),)
-        if ypa > 90 or ypa < -5:
+        maxyds = 500 if self.name == 'pass_yds' else 250
+        minuni = st.nct.cdf(-5., df, nc, loc=loc, scale=scale)
+        maxuni = st.nct.cdf(np.minimum(50*df, maxyds)/df, df, nc, loc=loc, scale=scale)
+        uni = minuni + uni*(maxuni-minuni)
+        ypa = st.nct.ppf(uni, df, nc, loc=loc, scale=scale)
+        bad = played & ((ypa > 90) | (ypa < -5))
+        if bad.any():
             # we might need to check to make sure this isn't possible
-            logging.warning('{} yards per attempt in {} attempts for {}'.format(ypa, att, self.name))
-            logging.warning('{} out of {}/{}'.format(uni, minuni, maxuni))
-        yds = att*ypa
-        return yds
+            logging.warning('{} yards per attempt in {} attempts for {}'.format(ypa[bad], att[bad], self.name))
+            logging.warning('{} out of {}/{}'.format(uni[bad], minuni[bad], maxuni[bad]))
+        yds = np.where(played, df*ypa, 0.)
+        return _as_output(yds)
     
     def ev(self, att):
         # the mean is mu*nu / nu
@@ -351,44 +523,80 @@ class YdsPerAttModel(Model):
     def cdf(self, yds, att):
         # can also just look at the CDF and check that it's flat from 0 to 1
         # but the CDF is not easy to compute analytically
-        df,nc = att,self.skew
-        if df == 0:
-            # there can be nonzero rushing yards w/out an attempt due to laterals. just skip these.
-            # cdf is the number below, though, so it should return 1.
-            return 1.
-        cdf = st.nct.cdf(yds/att, df, nc,
-                         loc=self._loc(att),
-                         scale=self._scale(att))
+        yds, att = np.asarray(yds, dtype=float), np.asarray(att, dtype=float)
+        # there can be nonzero rushing yards w/out an attempt due to laterals. just skip these.
+        # cdf is the number below, though, so it should return 1.
+        # a placeholder of 1 attempt keeps scipy happy where these are masked out.
+        played = att > 0
+        df,nc = np.where(played, att, 1.),self.skew
+        cdf = st.nct.cdf(yds/df, df, nc,
+                         loc=self._loc(df),
+                         scale=self._scale(df))
         # if np.isnan(cdf):
         #     print('nan cdf')
         #     print(self.name)
-        return cdf
+        return _as_output(np.where(played, cdf, 1.))
+
+    def mid_cdf(self, yds, att):
+        # yards are treated as continuous
+        return self.cdf(yds, att)
     
     def chi_sq(self, yds, att):
-        df = self._df(att)
+        att = np.asarray(att, dtype=float)
+        # the normalization isn't defined w/ zero attempts
+        played = att > 0
+        df = np.where(played, self._df(att), 1.)
         # using nct.mean results in undefined when df = 1
         nc = self.skew
-        ncmean = self._ncmean(att)
-        scale = self._scale(att)
+        ncmean = self._ncmean(df)
+        scale = self._scale(df)
         norm = st.nct.logpdf( ncmean, df, self.skew, loc=0., scale=scale )
+        norm = np.where(played, norm, np.nan)
         
-        return 2.*(self.kld(yds, att) + norm)
+        return _as_output(2.*(self.kld(yds, att) + norm))
     
     def kld(self, yds, att):
-        df = self._df(att)
-        if df == 0:
-            # the pdf is undefined, but there is no information lost so just return 0
-            # i.e. the data and model are both distributed as a delta function at 0.
-            return 0.
+        yds, att = np.asarray(yds, dtype=float), np.asarray(att, dtype=float)
+        # w/ zero attempts the pdf is undefined, but there is no information lost so just return 0
+        # i.e. the data and model are both distributed as a delta function at 0.
+        # these entries are evaluated w/ a placeholder of 1 attempt and masked out.
+        played = att > 0
+        df = np.where(played, self._df(att), 1.)
         nc = self.skew
         # print(ncmean, st.nct.mean(df, nc)) # these are the same
         # the problem w/ using the mean for the offset is that this blows up for df = 1
         # the skew parameter is in between the mode and mean, so let's just use this
-        loc = self._loc(att)
-        scale = self._scale(att)
-        result = - st.nct.logpdf(yds/att, df, nc, loc=loc,
+        loc = self._loc(df)
+        scale = self._scale(df)
+        result = - st.nct.logpdf(yds/df, df, nc, loc=loc,
                                  scale=scale)
-        return result
+        return _as_output(np.where(played, result, 0.))
+
+    def kld_grad(self, yds, att):
+        yds, att = np.asarray(yds, dtype=float), np.asarray(att, dtype=float)
+        played = att > 0
+        df = np.where(played, self._df(att), 1.)
+        nc = self.skew
+        munu,nu,alpha,beta = tuple(self.mnab)
+        scale = self._scale(df)
+        z = (yds/df - self._loc(df))/scale
+        # the kld is -logpdf(z) + log(scale) in terms of the standardized nct.
+        # its derivatives w.r.t. z and the non-centrality don't have a simple form, so they are taken numerically.
+        h = 1e-4
+        dgdz = (st.nct.logpdf(z+h, df, nc) - st.nct.logpdf(z-h, df, nc))/(2*h)
+        dgdnc = (st.nct.logpdf(z, df, nc+h) - st.nct.logpdf(z, df, nc-h))/(2*h)
+        dkld_dloc = dgdz/scale
+        dkld_dscale = (dgdz*z + 1.)/scale
+        # the loc and scale in terms of the state
+        ncfact = np.where(df > 1, 1/(1 - 3/(4*np.maximum(df, 2.)-1)), 1.) # ncmean/skew
+        dscale = np.array((np.zeros_like(scale), -scale/(2*nu*(nu+1)), -scale/(2*alpha), scale/(2*beta)))
+        dloc = -nc*ncfact*dscale
+        dloc[0] += 1./nu
+        dloc[1] -= munu/nu**2
+        dkld = dkld_dloc*dloc + dkld_dscale*dscale
+        dhyper = np.zeros((len(self._hyperpar_bounds()),) + np.shape(att))
+        dhyper[4] = -dkld_dloc*scale*ncfact - dgdnc
+        return np.where(played, dkld, 0.), np.where(played, dhyper, 0.)
 
     def __str__(self):
         parstr = u'\u03BC\t= {:.2f}\n\u03BD\t= {:.2f}\n\u03B1\t= {:.2f}\n\u03B2\t= {:.2f}\n'.format(self.mnab[0]/self.mnab[1], *self.mnab[1:])
@@ -430,16 +638,22 @@ class CountsModelMM(Model):
         m0,m1,m2 = self.mom[0], self.mom[1], self.mom[2]
         r = m1**2/(m0*m2 - m0*m1 - m1**2)
         p = m0*m1/(m2*m0 - m1**2)
-        if (r <= 0 or p <= 0):
+        if np.any(r <= 0) or np.any(p <= 0):
             print('invalid parameter space!')
             print((r,p))
             print(self.mom)
             exit(1)
         return (r,p)
         
+    def get_state(self):
+        return self.mom.copy()
+
+    def set_state(self, state):
+        self.mom = np.array(state, dtype=float)
+
     def update_game(self, att):
         self.mom *= self.game_mem
-        self.mom += self.game_lr * np.array((1., att, att**2))
+        self.mom += self.game_lr * np.array((np.ones_like(att), att, att**2))
         # we could accumulate a KLD to diagnose when the model has been very off recently
 
     def new_season(self):
@@ -172,3 +172,12 @@ ram_league = Ruleset(
     ppFG40=3,
     ppFG50=3
     )
+
+# look up the rulesets by their short names
+rulesets = {
+    'phys': phys_league,
+    'dude': dude_league,
+    'bro': bro_league,
+    'nycfc': nycfc_league,
+    'ram': ram_league,
+}
@@ -2,9 +2,14 @@
 from get_player_stats import *
 from playermodels.positions import *
 from ruleset import *
-from get_fantasy_points import get_points
+from get_fantasy_points import get_points, get_points_multi
+from model_cache import *
+from sim_store import SimWriter, saved_players
 import os.path
 import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
 import numpy.random as rand
 
@@ -26,41 +31,281 @@ def get_player_from_df(df, pname, pos=None, team=None):
     return None
     
 
-def main():
-    logging.getLogger().setLevel(logging.DEBUG)
-    np.set_printoptions(precision=4)
-    pd.options.display.precision = 2 # default is 6
-    
-    parser = argparse.ArgumentParser(description='generate projections')
-    parser.add_argument('position', type=str, choices=['QB', 'RB', 'WR', 'TE'], help='which position to simulate')
-    parser.add_argument('--ruleset', type=str, choices=['phys', 'dude', 'bro', 'nycfc'],
-                        default='phys', help='which ruleset to use')
-    parser.add_argument('--year',nargs='?', type=int, default=2018, help='what is the current year')
-    parser.add_argument('--expert-touch', nargs='?', type=bool, default=True, help='scale models to meet expert consensus for rush attempts and targets')
-    parser.add_argument('--n-seasons',nargs='?', type=int, default=128, help='number of seasons to simulate')
+# the quantiles of the weekly points that are saved, at -2, -1, 0, +1, and +2 sigma
+sim_quantiles = (0.02275, 0.15865, 0.5, 0.84135, 0.97725)
+# number of seasons simulated at a time in adaptive mode
+adaptive_chunk_seasons = 16
 
-    args = parser.parse_args()
-    pos = args.position
-    current_year = args.year
+def seasons_to_converge(pmod, rules, pgames, target_se, rng, td_rng=None, qmc=False, max_seasons=1024, nreps=16):
+    """
+    find how many simulated seasons are needed for the standard error on the quantiles of weekly points to fall below target_se.
+    the error is estimated from the spread between independent repetitions, and the number of seasons is doubled until it is small enough.
+    td_rng: random generator to pick which TDs are long (see scoring_rng)
+    returns None if the target isn't reached by max_seasons.
+    """
+    nseasons = 8
+    while nseasons <= max_seasons:
+        quants = [np.quantile(get_points(rules, pmod.gen_games(pgames*nseasons, rng=rng, qmc=qmc), rng=td_rng), sim_quantiles)
+                  for _ in range(nreps)]
+        if np.std(quants, axis=0, ddof=1).max() < target_se:
+            return nseasons
+        nseasons *= 2
+    return None
+
+
+def train_player(pos, pfr_id, rules, use_cache=True, hyperpars=None, corr_prior_games=None):
+    """
+    train a position model on a player's history of games.
+    returns the model and, for each ruleset, the array of fractional errors of weekly points w.r.t. each season's mean.
+    the trained state is saved to disk, so the next time only the games that have been added since need to be learned from.
+    pfr_id: the player's id, or None for a player w/out any history (e.g. rookies)
+    rules: list of rulesets to find the errors for
+    hyperpars: flat array of the position model's hyperparameters (read from the registry if None)
+    corr_prior_games: if provided, also learn the player's own correlations between stats (see PlayerCorrelation)
+    """
+    pmod = gen_player_model(pos, hyperpars, corr_prior_games)
+        
+    pdf = get_player_stats(pfr_id).fillna(0) if pfr_id is not None else pd.DataFrame(columns=['player', 'pos', 'team', 'year', 'game_num'])
+    stat_vars = [model.pred_var for model in pmod.models]
+    for st in stat_vars:
+        if st not in pdf:
+            pdf[st] = 0 # set non-existent values to zero
+
+    years = pdf['year'].unique()
+    # if len(years) == 0:
+        # then we need to debug why this player isn't being read, tho this should be fine for rookies
+        # logging.error(' no player data for {}!'.format(pname))
+            
+    assert((np.diff(years) > 0).all())
+
+    # these are the columns the model depends on
+    hash_cols = ['year', 'game_num'] + stat_vars
+    rhashes = [rules_hash(rs) for rs in rules]
+    ngames,lastyear,pcterrs_saved = 0,None,{}
+    yearerrs = [{} for _ in rules]
+    cache = load_model_cache(pfr_id, pmod) if (use_cache and pfr_id is not None) else None
+    if cache is not None:
+        stats_hash = file_hash('data/players/{}.csv'.format(pfr_id))
+        # if the stats file has changed, the saved state is still good as long as the games it learned from are the same.
+        if cache['stats_hash'] == stats_hash or \
+           (cache['ngames'] <= len(pdf) and cache['rows_hash'] == rows_hash(pdf, hash_cols, cache['ngames'])):
+            pmod.set_state(cache['state'])
+            ngames,lastyear = cache['ngames'],cache['year']
+            pcterrs_saved = cache['pcterrs']
+            yearerrs = [{int(yr):errs for yr,errs in pcterrs_saved.get(rh, {}).items()} for rh in rhashes]
+            logging.debug('loaded saved model for {} after {} games'.format(pfr_id, ngames))
+        else:
+            logging.info('history for {} has changed. re-training from the start.'.format(pfr_id))
+
+    # only the games that haven't been learned from yet are applied.
+    # the state is kept before the end-of-season decay, so more games can be added to the latest season.
+    newdf = pdf.iloc[ngames:]
+    for year in newdf['year'].unique():
+        if lastyear is not None and year != lastyear:
+            pmod.new_season()
+        ydf = newdf[newdf['year'] == year]
+        games = ydf['game_num']
+        assert((np.diff(games) > 0).all()) # this sometimes fails when players are traded mid-week. we could just pick the one with the most points (so far just manually deleting)
+        for _,game in ydf.iterrows():
+            pmod.update_game(game)
+        lastyear = year
+
+    # the errors of the seasons w/ new games need to be re-computed, as the season's mean has changed.
+    # every game is scored under every ruleset at once.
+    new_errs = False
+    allpts = get_points_multi(rules, pdf).values
+    for rspts,rserrs in zip(allpts.T, yearerrs):
+        for year in years:
+            if year in rserrs and (len(newdf) == 0 or year < newdf['year'].iloc[0]):
+                continue
+            new_errs = True
+            ypts = rspts[(pdf['year'] == year).values]
+            meanpts = ypts.mean()
+            # evs = pmod.evs() # expected outcome
+            # expt = get_points(rules, evs) # works from dict too?
+            rserrs[year] = list((ypts-meanpts)/meanpts) if meanpts != 0 else []
+
+    if use_cache and pfr_id is not None and (len(newdf) > 0 or new_errs):
+        if len(newdf) > 0:
+            # the saved errors for other rulesets are out of date for the seasons that got new games
+            for rh in pcterrs_saved:
+                pcterrs_saved[rh] = {yr:errs for yr,errs in pcterrs_saved[rh].items() if int(yr) < newdf['year'].iloc[0]}
+        for rh,rserrs in zip(rhashes, yearerrs):
+            pcterrs_saved[rh] = {int(yr):[float(e) for e in errs] for yr,errs in rserrs.items()}
+        save_model_cache(pfr_id, pmod, {
+            'stats_hash': file_hash('data/players/{}.csv'.format(pfr_id)),
+            'ngames': len(pdf),
+            'rows_hash': rows_hash(pdf, hash_cols, len(pdf)),
+            'year': int(lastyear),
+            'state': pmod.get_state(),
+            'pcterrs': pcterrs_saved,
+        })
+    if lastyear is not None:
+        pmod.new_season()
+
+    pcterrs = [np.array([err for year in years for err in rserrs[year]]) for rserrs in yearerrs]
+    for rserrs in pcterrs:
+        if np.isnan(rserrs).any():
+            print(rserrs)
+            exit(1)
+    return pmod,pcterrs
+
+
+def scoring_rng(seed):
+    """
+    the random generator for picking which of a player's simulated TDs are long, separate from the one the games are drawn from.
+    this way the simulated games don't depend on which rulesets are scored.
+    it is made from the first child of the player's seed sequence, which doesn't depend on whether the seed has been spawned from before.
+    """
+    ss = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return np.random.default_rng(np.random.SeedSequence(ss.entropy, spawn_key=ss.spawn_key + (0,), pool_size=ss.pool_size))
+
+
+def simulate_adaptive(pmod, rules, pgames, target_se, rng, td_rng=None, qmc=False, chunk_seasons=adaptive_chunk_seasons, max_seasons=1024):
+    """
+    simulate seasons in chunks until the standard errors of the mean and the 1-sigma quantiles of weekly points fall below target_se.
+    the errors are estimated from the spread between chunks, so a few chunks are always run.
+    stable players stop early and volatile ones get more seasons, up to max_seasons.
+    rules: list of rulesets, all of which need to reach the target
+    td_rng: random generator to pick which TDs are long (see scoring_rng)
+    returns the dataframe of simulated games, their points under each ruleset (as from get_points_multi), and the number of seasons used.
+    the points are the ones the stopping rule was checked on, so the long TDs aren't drawn again.
+    """
+    assert(max_seasons >= chunk_seasons)
+    if pgames == 0:
+        # there is nothing to simulate (e.g. a player suspended for the whole season)
+        games = pd.DataFrame(pmod.gen_games(0, rng=rng, qmc=qmc))
+        return games, get_points_multi(rules, games, rng=td_rng), 0
+    chunks,chunk_fps,chunk_stats = [],[],[]
+    nseasons = 0
+    while nseasons < max_seasons:
+        # the last chunk is cut short so that max_seasons is never exceeded
+        nchunk = min(chunk_seasons, max_seasons - nseasons)
+        games = pd.DataFrame(pmod.gen_games(pgames*nchunk, rng=rng, qmc=qmc))
+        chunks.append(games)
+        nseasons += nchunk
+        allfps = get_points_multi(rules, games, rng=td_rng)
+        chunk_fps.append(allfps)
+        chunk_stats.append(np.append(allfps.mean().values, allfps.quantile((sim_quantiles[1], sim_quantiles[3])).values))
+        if len(chunks) >= 4:
+            ses = np.std(chunk_stats, axis=0, ddof=1) / np.sqrt(len(chunks))
+            if (ses < target_se).all():
+                break
+    return pd.concat(chunks, ignore_index=True), pd.concat(chunk_fps, ignore_index=True), nseasons
+
+
+def simulate_player(exproj, prow, psus, seed, pos, rules, nseasons, scale_touch=True,
+                    qmc=False, convergence_se=None, adaptive_se=None, max_seasons=1024, use_cache=True, keep_sims=False,
+                    hyperpars=None, corr_prior_games=None):
+    """
+    train the model for a single player on their history and then simulate their season.
+    the simulated games are scored under each ruleset, so the player only needs to be simulated once for all of them.
+    returns a dictionary of ruleset name to the dictionary of results for this player.
+    exproj: the row of expert projections for this player
+    prow: the player's row in the index (None if they don't have one, e.g. rookies)
+    psus: the player's suspension data (None if there isn't any)
+    seed: seed for this player's random number generator, so that results don't depend on the order players are run in.
+    rules: dictionary of ruleset name to ruleset
+    qmc: simulate w/ scrambled sobol points instead of pseudo-random numbers
+    convergence_se: if provided, also find the number of seasons each sampling mode needs to get this standard error on the quantiles
+    adaptive_se: if provided, simulate until the standard error on the weekly points is this small (up to max_seasons) instead of for nseasons
+    use_cache: start from the saved model state for this player, if it is still valid
+    keep_sims: also return the simulated games and their points under each ruleset (as fpts_<name>) under the key 'sims'
+    hyperpars: flat array of the position model's hyperparameters, so that worker processes don't have to load them
+    corr_prior_games: if provided, simulate w/ the player's own correlations, w/ the position's worth this many games
+    """
+    ngames = 16
+    pname = exproj['player']
+    rng = np.random.default_rng(seed)
+    td_rng = scoring_rng(seed)
+    logging.info('training model for {}'.format(pname))
+
+    pmod,pcterrs = train_player(pos, prow['pfr_id'] if prow is not None else None, list(rules.values()), use_cache=use_cache,
+                                hyperpars=hyperpars, corr_prior_games=corr_prior_games)
+    stat_vars = pmod.stats
     
-    if args.ruleset == 'phys':
-        rules = phys_league
-    if args.ruleset == 'dude':
-        rules = dude_league
-    if args.ruleset == 'bro':
-        rules = bro_league
-    if args.ruleset == 'nycfc':
-        rules = nycfc_league
+    # now we're done training; do simulations next
+    # get the number of games a player is expected to play
+    pgames = ngames # number of games this player expects to play. we'll check suspensions:
+    if psus is not None:
+        gsus = psus.games_suspended
+        logging.info(psus.details)
+        if not np.isnan(gsus):
+            pgames -= int(gsus)
+            logging.info(' -- {} game suspension'.format(gsus))
+        else:
+            logging.info('suspension time unknown.')
 
-    scale_touch = args.expert_touch
+    if scale_touch:
+        re_ev_dict = {}
+        for touchvar in set(stat_vars) & set(['pass_att', 'rush_att']):
+            re_ev_dict[touchvar] = exproj[touchvar]/pgames
+        if 'targets' in stat_vars:
+            # expert projections from this source don't have targets, just receptions
+            modevs = pmod.evs()
+            re_ev_dict['targets'] = modevs['targets'] * exproj['rec'] / modevs['rec'] / pgames
+        pmod.revert_evs(re_ev_dict)
+        
+    # if pname in ['Todd Gurley', 'Ezekiel Elliott', 'Le\'Veon Bell', 'Saquon Barkley', 'Royce Freeman']:
+    # if pname in ['dDeAndre Hopkins', 'Odell Beckham Jr.']:
+    #     print(pmod)
+
+    if adaptive_se is None:
+        fpdf = pd.DataFrame(pmod.gen_games(pgames*nseasons, rng=rng, qmc=qmc))
+        allfps = get_points_multi(list(rules.values()), fpdf, rng=td_rng)
+    else:
+        fpdf,allfps,nseasons = simulate_adaptive(pmod, list(rules.values()), pgames, adaptive_se, rng, td_rng=td_rng,
+                                                 qmc=qmc, max_seasons=max_seasons)
+
+    evs = {key:(pgames*val) for key,val in pmod.evs().items()}
+    evdats,simfps = {},{}
+    # fps = pd.concat((get_points( rules, fpdf )), ignore_index=True)
+    for (rsname,rs),(_,fps),rserrs in zip(rules.items(), allfps.items(), pcterrs):
+        simfps['fpts_'+rsname] = fps
+
+        largegames = fps > 50
+        if largegames.any():
+            print(pname)
+            print(fpdf[largegames])
+
+        fp_2d,fp_1d,fp_med,fp_1u,fp_2u = fps.quantile(sim_quantiles)
+        evdat = evs.copy()
+        evdat['player'] = pname
+        evdat['pos'] = pos
+        evdat['g'] = pgames
+        evdat['n_seasons'] = nseasons
+        evdat['ex_pred'] = exproj['fp_projection']
+        # the single-game bonuses don't apply to the season totals
+        evdat['fpts_ev'] = get_points( rs, evdat, per_game=False )
+        evdat['fpts_sim'] = fps.mean()*pgames
+        evdat['fpts_med'] = fp_med
+        evdat['fpts_simstd'] = fps.std()*np.sqrt(pgames)
+        evdat['volatility'] = np.sqrt(np.mean(rserrs**2))
+        # every player needs the same fields so their rows can be written out as they finish
+        evdat['vol1'] = 0.5*(fp_1u - fp_1d)/fp_med if fp_med > 0 else np.nan
+        evdat['vol2'] = 0.5*(fp_2u - fp_2d)/fp_med if fp_med > 0 else np.nan
+        evdat['fpts_u1'] = fp_1u
+        evdat['fpts_d1'] = fp_1d
+        evdats[rsname] = evdat
+    if convergence_se is not None:
+        for rsname,rs in rules.items():
+            evdats[rsname]['n_seasons_mc'] = seasons_to_converge(pmod, rs, pgames, convergence_se, rng, td_rng=td_rng, qmc=False)
+            evdats[rsname]['n_seasons_sobol'] = seasons_to_converge(pmod, rs, pgames, convergence_se, rng, td_rng=td_rng, qmc=True)
+    if keep_sims:
+        evdats['sims'] = fpdf.assign(**simfps)
+    return evdats
 
+
+def get_player_inputs(pos, current_year):
+    """
+    get the inputs to simulate_player for each relevant player at a position, in the order of the expert projections.
+    returns lists of the expert projections, index rows, suspension data, and random seeds.
+    """
     # get player index
     pidx = get_pos_players(pos)
     # players like Luck who didn't play last year will be ruled out here.
     # we have the expert list to compare to so we can allow another year back.
     pidx = pidx[(pidx['pos'] == pos) & (pidx['year_max'] >= current_year-2)]
-    ngames = 16
-    nseasons = args.n_seasons
 
     # get expert projections so we can adjust to touches
     expertdf = pd.read_csv('preseason_rankings/project_fp_{}_pre{}.csv'.format(pos.lower(), current_year))
@@ -68,119 +313,227 @@ def main():
     # any known suspension data
     sussdf = pd.read_csv('data/suspensions.csv')
 
-    # data of expectation values to print out at the end (and possibly save)
-    evdf = pd.DataFrame(columns=['player', 'pos'], dtype=int)
-
-    np.random.seed(3490) # pick a constant seed so we can debug weird outcomes
+    # pick a constant seed so we can debug weird outcomes.
+    # each player gets their own stream spawned from it, so results don't depend on the number of jobs.
+    seeds = np.random.SeedSequence(3490).spawn(len(expertdf))
     
+    exprojs,prows,psuss,pseeds = [],[],[],[]
     # for _,prow in pidx.iterrows():
-    for _,exproj in expertdf.iterrows():
+    for (_,exproj),seed in zip(expertdf.iterrows(), seeds):
         pname = exproj['player']
         if exproj['fp_projection'] < 32:
             logging.debug('skipping {} as irrelevant'.format(pname))
             continue
         # pname,pid = prow[['player', 'pfr_id']]
-        logging.info('training model for {}'.format(pname))
-
         prow = get_player_from_df(pidx, pname)
         # exproj = get_player_from_df(expertdf, pname)
         # if exproj is None:
         #     # they are probably retired; let's not waste time simulating them
         #     logging.warning('no expert projection for {}. skipping.'.format(pname))
         #     continue
-                
-        pmod = gen_player_model(pos)
-        
-        pdf = get_player_stats(prow['pfr_id']).fillna(0) if prow is not None else pd.DataFrame(columns=['player', 'pos', 'team', 'year'])
-        stat_vars = [model.pred_var for model in pmod.models]
-        for st in stat_vars:
-            if st not in pdf:
-                pdf[st] = 0 # set non-existent values to zero
-
-        years = pdf['year'].unique()
-        # if len(years) == 0:
-            # then we need to debug why this player isn't being read, tho this should be fine for rookies
-            # logging.error(' no player data for {}!'.format(pname))
-            
-        assert((np.diff(years) > 0).all())
-        pcterrs = []
-        for year in years:
-            ydf = pdf[pdf['year'] == year]
-            games = ydf['game_num']
-            assert((np.diff(games) > 0).all()) # this sometimes fails when players are traded mid-week. we could just pick the one with the most points (so far just manually deleting)
-            meanpts = get_points(rules, ydf).mean()
-            
-            for _,game in ydf.iterrows():
-                # evs = pmod.evs() # expected outcome
-                # expt = get_points(rules, evs) # works from dict too?
-                if meanpts != 0:
-                    actpt = get_points(rules, game)
-                    pcterrs.append((actpt-meanpts)/meanpts)
-                pmod.update_game(game)
-            pmod.new_season()
+        psus = get_player_from_df(sussdf, pname, pos)
+        exprojs.append(exproj)
+        prows.append(prow)
+        psuss.append(psus)
+        pseeds.append(seed)
 
-        pcterrs = np.array(pcterrs)
-        if np.isnan(pcterrs).any():
-            print(pcterrs)
-            exit(1)
+    return exprojs,prows,psuss,pseeds
+
+
+def map_players(sim_player, *inputs, jobs=1):
+    """
+    run sim_player on each player's inputs.
+    players are independent, so they can be spread over a pool of processes.
+    this is a generator that yields each result as soon as it's ready, in the order of the input.
+    """
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            yield from executor.map(sim_player, *inputs)
+    else:
+        yield from map(sim_player, *inputs)
+
+
+def sim_columns(pos, convergence=False):
+    """
+    the fixed list of columns in the simulation output for a position
+    """
+    columns = gen_player_model(pos).stats
+    columns += ['player', 'pos', 'g', 'n_seasons', 'ex_pred', 'fpts_ev', 'fpts_sim', 'fpts_med', 'fpts_simstd',
+                'volatility', 'vol1', 'vol2', 'fpts_u1', 'fpts_d1']
+    if convergence:
+        columns += ['n_seasons_mc', 'n_seasons_sobol']
+    return columns
+
+
+def sim_output_file(pos, current_year, rsname):
+    return 'data/{}_{}_simulations_{}.csv'.format(pos.lower(), rsname, current_year)
+
+
+def sim_options_file(pos, current_year, rsname):
+    return 'data/{}_{}_simulations_{}_options.json'.format(pos.lower(), rsname, current_year)
+
+
+def save_sim_options(fname, options):
+    """
+    record the options of simulate_player that a simulation output was made with,
+    so that players updated later (see weekly_update.py) are simulated the same way as the rest.
+    """
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(options, f, indent=1)
+    os.replace(fname + '.tmp', fname)
+
+
+def load_sim_options(fname):
+    """
+    the options recorded by save_sim_options, or None if there aren't any
+    """
+    if not os.path.isfile(fname):
+        return None
+    with open(fname) as f:
+        return json.load(f)
+
+
+def done_players(fname, columns):
+    """
+    the set of players already in the simulation output of an interrupted run
+    """
+    if not os.path.isfile(fname) or os.path.getsize(fname) == 0:
+        return set()
+    # a crash in the middle of a write could leave an incomplete last line, which should be re-done
+    with open(fname, 'rb+') as fin:
+        data = fin.read()
+        if not data.endswith(b'\n'):
+            fin.truncate(data.rfind(b'\n')+1)
+        if b'\n' not in data:
+            # even the header wasn't finished, so there is nothing to keep
+            fin.seek(0)
+            fin.truncate()
+            fin.write((','.join(columns) + '\n').encode())
+            return set()
+    donedf = pd.read_csv(fname)
+    if list(donedf.columns) != columns:
+        logging.error('columns in {} do not match this run. can not resume.'.format(fname))
+        raise ValueError('mismatched columns in {}'.format(fname))
+    return set(donedf['player'])
+
+
+def open_sim_output(fname, columns, keep=()):
+    """
+    open the simulation output to append player rows to as they finish.
+    the rows of the players in keep are kept from a previous run; otherwise the file is started over.
+    """
+    if len(keep) > 0:
+        # drop any players that didn't get written to every output before an interruption
+        donedf = pd.read_csv(fname, float_precision='round_trip')
+        if not donedf['player'].isin(keep).all():
+            donedf[donedf['player'].isin(keep)].to_csv(fname, index=False)
+        return open(fname, 'a')
+    fout = open(fname, 'w')
+    fout.write(','.join(columns) + '\n')
+    return fout
+
+
+def main():
+    logging.getLogger().setLevel(logging.DEBUG)
+    np.set_printoptions(precision=4)
+    pd.options.display.precision = 2 # default is 6
     
-        # now we're done training; do simulations next
-        # get the number of games a player is expected to play
-        pgames = ngames # number of games this player expects to play. we'll check suspensions:
-        psus = get_player_from_df(sussdf, pname, pos)
-        if psus is not None:
-            gsus = psus.games_suspended
-            logging.info(psus.details)
-            if not np.isnan(gsus):
-                pgames -= int(gsus)
-                logging.info(' -- {} game suspension'.format(gsus))
-            else:
-                logging.info('suspension time unknown.')
-
-        if scale_touch:
-            re_ev_dict = {}
-            for touchvar in set(stat_vars) & set(['pass_att', 'rush_att']):
-                re_ev_dict[touchvar] = exproj[touchvar]/pgames
-            if 'targets' in stat_vars:
-                # expert projections from this source don't have targets, just receptions
-                modevs = pmod.evs()
-                re_ev_dict['targets'] = modevs['targets'] * exproj['rec'] / modevs['rec'] / pgames
-            pmod.revert_evs(re_ev_dict)
-        
-        # if pname in ['Todd Gurley', 'Ezekiel Elliott', 'Le\'Veon Bell', 'Saquon Barkley', 'Royce Freeman']:
-        # if pname in ['dDeAndre Hopkins', 'Odell Beckham Jr.']:
-        #     print(pmod)
+    parser = argparse.ArgumentParser(description='generate projections')
+    parser.add_argument('position', type=str, choices=['QB', 'RB', 'WR', 'TE'], help='which position to simulate')
+    parser.add_argument('--ruleset', type=str, nargs='+', choices=['phys', 'dude', 'bro', 'nycfc', 'ram'],
+                        default=['phys'], help='which rulesets to score with. each gets its own output.')
+    parser.add_argument('--year',nargs='?', type=int, default=2018, help='what is the current year')
+    parser.add_argument('--expert-touch', nargs='?', type=bool, default=True, help='scale models to meet expert consensus for rush attempts and targets')
+    parser.add_argument('--n-seasons',nargs='?', type=int, default=128, help='number of seasons to simulate')
+    parser.add_argument('--jobs', type=int, default=1, help='number of processes to train and simulate players with')
+    parser.add_argument('--sampling', type=str, choices=['mc', 'sobol'], default='mc',
+                        help='simulate with pseudo-random (mc) or scrambled sobol (quasi-monte carlo) points')
+    parser.add_argument('--convergence-se', type=float, default=None,
+                        help='report the number of seasons each sampling mode needs to reach this standard error on the weekly point quantiles')
+    parser.add_argument('--adaptive-se', type=float, default=None,
+                        help='simulate each player until the standard error on their weekly point mean and 1-sigma quantiles is below this')
+    parser.add_argument('--max-seasons', type=int, default=1024, help='maximum number of seasons to simulate in adaptive mode')
+    parser.add_argument('--no-model-cache', action='store_true', help='re-train every player from scratch instead of loading saved models')
+    parser.add_argument('--resume', action='store_true', help='skip players that are already in the output from an interrupted run')
+    parser.add_argument('--save-sims', action='store_true', help='save every simulated game of each player to data/sims/')
+    parser.add_argument('--player-corr', type=float, default=None, metavar='PRIOR_GAMES',
+                        help='learn each player\'s own correlations between stats, w/ the position\'s counting as this many games')
 
-        fpdf = pd.concat([pd.DataFrame((pmod.gen_game() for _ in range(pgames))) for _ in range(nseasons)], ignore_index=True)
-        # fps = pd.concat((get_points( rules, fpdf )), ignore_index=True)
-        fps = get_points( rules, fpdf )
+    args = parser.parse_args()
+    if args.max_seasons < adaptive_chunk_seasons:
+        parser.error('--max-seasons must be at least {}'.format(adaptive_chunk_seasons))
+    if args.player_corr is not None and args.player_corr <= 0:
+        parser.error('--player-corr must be positive')
+    pos = args.position
+    current_year = args.year
+    
+    # de-duplicate while keeping the order
+    rules = {rsname:rulesets[rsname] for rsname in args.ruleset}
 
-        largegames = fps > 50
-        if largegames.any():
-            print(pname)
-            print(fpdf[largegames])
-        
-        fp_2d,fp_1d,fp_med,fp_1u,fp_2u = fps.quantile((0.02275, 0.15865, 0.5, 0.84135, 0.97725))
-        evdat = {key:(pgames*val) for key,val in pmod.evs().items()}
-        evdat['player'] = pname
-        evdat['pos'] = pos
-        evdat['g'] = pgames
-        evdat['ex_pred'] = exproj['fp_projection']
-        evdat['fpts_ev'] = get_points( rules, evdat )
-        evdat['fpts_sim'] = fps.mean()*pgames
-        evdat['fpts_med'] = fp_med
-        evdat['fpts_simstd'] = fps.std()*np.sqrt(pgames)
-        evdat['volatility'] = np.sqrt(np.mean(pcterrs**2))
-        if fp_med > 0:
-            evdat['vol1'] = 0.5*(fp_1u - fp_1d)/fp_med
-            evdat['vol2'] = 0.5*(fp_2u - fp_2d)/fp_med
-        evdat['fpts_u1'] = fp_1u
-        evdat['fpts_d1'] = fp_1d
-        
-        evdf = evdf.append(evdat, ignore_index=True)
-        
-    print(evdf.sort_values('fpts_ev', ascending=False))
-    evdf.to_csv('data/{}_simulations_{}.csv'.format(pos.lower(), current_year), index=False)
+    scale_touch = args.expert_touch
+
+    nseasons = args.n_seasons
+    exprojs,prows,psuss,pseeds = get_player_inputs(pos, current_year)
+
+    fnames = {rsname:sim_output_file(pos, current_year, rsname) for rsname in rules}
+    columns = sim_columns(pos, convergence=(args.convergence_se is not None))
+    # the options that change the simulated results. keep_sims only changes what is saved.
+    sim_options = {'nseasons': nseasons, 'scale_touch': scale_touch, 'qmc': (args.sampling == 'sobol'),
+                   'convergence_se': args.convergence_se, 'adaptive_se': args.adaptive_se,
+                   'max_seasons': args.max_seasons, 'use_cache': (not args.no_model_cache),
+                   'corr_prior_games': args.player_corr}
+    optfnames = {rsname:sim_options_file(pos, current_year, rsname) for rsname in rules}
+    if args.resume:
+        for optfname in optfnames.values():
+            saved = load_sim_options(optfname)
+            if saved is not None and saved != sim_options:
+                logging.error('the options in {} do not match this run. can not resume.'.format(optfname))
+                raise ValueError('mismatched options in {}'.format(optfname))
+    for optfname in optfnames.values():
+        save_sim_options(optfname, sim_options)
+    # a player is only done if they are in every output
+    done = set.intersection(*[done_players(fname, columns) for fname in fnames.values()]) if args.resume else set()
+    if args.resume:
+        logging.info('resuming: {} players are already done'.format(len(done)))
+    # e.g. the interrupted run didn't save the simulations. the store would be missing the players that are done.
+    unsaved = done - saved_players(pos, current_year) if args.save_sims else set()
+    if unsaved:
+        logging.error('the saved simulations are missing {} players that are done. can not resume w/ --save-sims.'
+                      .format(len(unsaved)))
+        raise ValueError('players missing from the saved simulations')
+    simfields = gen_player_model(pos).stats + ['fpts_'+rsname for rsname in rules]
+    simf = SimWriter(pos, current_year, simfields, resume=args.resume) if args.save_sims else None
+    fouts = {rsname:open_sim_output(fname, columns, keep=done) for rsname,fname in fnames.items()}
+    todo = [i for i,exproj in enumerate(exprojs) if exproj['player'] not in done]
+    pick = lambda lst: [lst[i] for i in todo]
+
+    sim_player = partial(simulate_player, pos=pos, rules=rules, keep_sims=args.save_sims,
+                         hyperpars=gen_player_model(pos).hyperpars(), **sim_options)
+    # each player's rows are written as soon as they're done, so an interrupted run can be resumed
+    for evdats,prow in zip(map_players(sim_player, pick(exprojs), pick(prows), pick(psuss), pick(pseeds), jobs=args.jobs),
+                           pick(prows)):
+        if simf is not None:
+            # the full simulations go first so that every player in the output has them
+            evdat = evdats[next(iter(rules))]
+            simf.append(evdat['player'], prow['pfr_id'] if prow is not None else None,
+                        evdat['g'], evdat['n_seasons'], evdats.pop('sims'))
+        for rsname,fout in fouts.items():
+            pd.DataFrame([evdats[rsname]], columns=columns).to_csv(fout, header=False, index=False)
+            fout.flush()
+    for fout in fouts.values():
+        fout.close()
+    if simf is not None:
+        simf.close()
+
+    # data of expectation values to print out at the end
+    for rsname,fname in fnames.items():
+        evdf = pd.read_csv(fname)
+        print('{} ruleset:'.format(rsname))
+        print(evdf.sort_values('fpts_ev', ascending=False))
+        if args.convergence_se is not None:
+            print('seasons needed for a standard error of {} on the weekly point quantiles:'.format(args.convergence_se))
+            print(evdf[['player', 'n_seasons_mc', 'n_seasons_sobol']])
+            print(evdf[['n_seasons_mc', 'n_seasons_sobol']].describe())
     
     return
 
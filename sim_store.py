@@ -0,0 +1,121 @@
+# save the full simulated distributions of each player, so that other tools can use them without re-simulating.
+# each position/year has a raw binary file of simulated games that can be memory-mapped,
+# an index of which rows belong to which player, and a small description of the fields.
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+sims_dir = 'data/sims'
+index_columns = ['player', 'pfr_id', 'offset', 'count', 'g', 'n_seasons']
+
+def sim_dtype(fields):
+    """
+    the record type of a simulated game: each stat and the fantasy points under each ruleset.
+    single precision is plenty for simulated values and halves the size.
+    """
+    return np.dtype([(field, np.float32) for field in fields])
+
+def _sim_files(pos, year):
+    base = os.path.join(sims_dir, '{}_{}'.format(pos.lower(), year))
+    return base + '.bin', base + '_index.csv', base + '.json'
+
+
+class SimWriter:
+    """
+    appends the simulated games of each player to the binary file as they finish.
+    the data is written before the index row, so an index entry always points to complete data.
+    """
+    def __init__(self, pos, year, fields, resume=False):
+        """
+        resume: append to the store of an earlier run instead of starting over.
+          if there isn't one, a new store is started; if only some of its files are there, it can't be resumed.
+        """
+        self.dtype = sim_dtype(fields)
+        binfile,idxfile,metafile = _sim_files(pos, year)
+        os.makedirs(sims_dir, exist_ok=True)
+        self.offset = 0
+        exist = [os.path.isfile(fname) for fname in (binfile, idxfile, metafile)]
+        if resume and any(exist) and not all(exist):
+            missing = [fname for fname,ex in zip((binfile, idxfile, metafile), exist) if not ex]
+            logging.error('the saved simulations in {} are missing {}. can not resume.'.format(sims_dir, ', '.join(missing)))
+            raise ValueError('incomplete simulation store in {}'.format(sims_dir))
+        if resume and all(exist):
+            with open(metafile) as f:
+                fields = json.load(f)['fields']
+            if fields != list(self.dtype.names):
+                raise ValueError('mismatched fields in {}'.format(metafile))
+            idxdf = pd.read_csv(idxfile)
+            if len(idxdf) > 0:
+                self.offset = int((idxdf['offset'] + idxdf['count']).max())
+            # drop anything written after the last complete player
+            with open(binfile, 'rb+') as f:
+                f.truncate(self.offset*self.dtype.itemsize)
+            self.binf = open(binfile, 'ab')
+            self.idxf = open(idxfile, 'a')
+        else:
+            with open(metafile, 'w') as f:
+                json.dump({'fields': list(self.dtype.names), 'dtype': 'float32'}, f)
+            self.binf = open(binfile, 'wb')
+            self.idxf = open(idxfile, 'w')
+            self.idxf.write(','.join(index_columns) + '\n')
+
+    def append(self, player, pfr_id, g, nseasons, games):
+        """
+        games: dictionary or dataframe of arrays of the simulated values, including the points under each ruleset
+        """
+        recs = np.empty(len(games[self.dtype.names[0]]), dtype=self.dtype)
+        for field in self.dtype.names:
+            recs[field] = games[field]
+        self.binf.write(recs.tobytes())
+        self.binf.flush()
+        pd.DataFrame([[player, pfr_id, self.offset, len(recs), g, nseasons]],
+                     columns=index_columns).to_csv(self.idxf, header=False, index=False)
+        self.idxf.flush()
+        self.offset += len(recs)
+
+    def close(self):
+        self.binf.close()
+        self.idxf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def saved_players(pos, year):
+    """
+    the set of players w/ simulations in the store (empty if there isn't one)
+    """
+    _,idxfile,_ = _sim_files(pos, year)
+    if not os.path.isfile(idxfile):
+        return set()
+    return set(pd.read_csv(idxfile)['player'])
+
+
+def load_sims(pos, year, players=None):
+    """
+    returns a dictionary of player name to their simulated games,
+    as a structured array with a field for each stat and for the points under each ruleset (fpts_<ruleset>).
+    the arrays are memory-mapped, so only the players that are used get read from disk.
+    each array can be reshaped to (n_seasons, g) to get the games in each simulated season.
+    players: list of players to get (all of them if None)
+    """
+    binfile,idxfile,metafile = _sim_files(pos, year)
+    if not os.path.isfile(idxfile):
+        logging.error('no saved simulations in {}'.format(sims_dir))
+        return {}
+    with open(metafile) as f:
+        dtype = sim_dtype(json.load(f)['fields'])
+    idxdf = pd.read_csv(idxfile)
+    # a player could be in the index more than once if a run was resumed after they were saved; the last one is current.
+    idxdf = idxdf.drop_duplicates('player', keep='last')
+    if players is not None:
+        idxdf = idxdf[idxdf['player'].isin(players)]
+    if len(idxdf) == 0:
+        return {}
+    data = np.memmap(binfile, dtype=dtype, mode='r')
+    return {row.player:data[row.offset:row.offset+row.count] for row in idxdf.itertuples()}
@@ -0,0 +1,103 @@
+# save tables of every player's games at a position in a columnar binary format, so they can be re-used in one quick read.
+# each column is a .npy file that is memory-mapped when loaded, and a small description lists the columns,
+# the rows where each player starts, and a key describing what the table was made from.
+# the table is rebuilt whenever the key changes, e.g. when a source file is modified or the hyperparameters change.
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+tables_dir = 'data/tables'
+
+def sources_key(fnames, *extra):
+    """
+    a key for the state of the source files, from their sizes and modification times.
+    this avoids reading every file just to tell whether a table is current.
+    extra: any other values the table depends on (e.g. hyperparameters), which must have a stable repr
+    """
+    h = hashlib.sha1()
+    for fname in fnames:
+        st = os.stat(fname)
+        h.update('{}:{}:{}\n'.format(fname, st.st_size, st.st_mtime_ns).encode())
+    for x in extra:
+        h.update(repr(x).encode())
+    return h.hexdigest()
+
+def _table_dir(name):
+    return os.path.join(tables_dir, name)
+
+def _column_array(col):
+    # strings (and anything else that isn't numeric) are saved as fixed-width unicode so they can be memory-mapped.
+    # missing values in float columns are kept as NaN. nullable integers are only saved as integers when none are missing.
+    if pd.api.types.is_extension_array_dtype(col.dtype) and col.dtype.kind in 'biu':
+        if col.isna().any():
+            return col.astype(float).to_numpy()
+        return col.to_numpy(dtype=col.dtype.numpy_dtype)
+    vals = col.to_numpy()
+    if vals.dtype.kind not in 'biuf':
+        vals = col.fillna('').astype(str).to_numpy().astype(str)
+    return vals
+
+
+def save_table(name, pdfs, key):
+    """
+    save the concatenation of each player's dataframe.
+    stats that some players don't have are filled w/ zero (or an empty string),
+    but missing values within a player's own columns (e.g. NaN diagnostics) are kept.
+    pdfs: list of dataframes of each player's games
+    key: the key that the table must match when loaded, e.g. from sources_key()
+    """
+    tdir = _table_dir(name)
+    os.makedirs(tdir, exist_ok=True)
+    metafile = os.path.join(tdir, 'meta.json')
+    # the description is written last, so a table that wasn't finished can't be loaded
+    if os.path.isfile(metafile):
+        os.remove(metafile)
+    offsets = np.cumsum([0] + [len(pdf) for pdf in pdfs])
+    # the fill value of each column, from the first player that has it
+    fills = {}
+    for pdf in pdfs:
+        for col in pdf.columns:
+            if col not in fills:
+                fills[col] = 0 if pd.api.types.is_numeric_dtype(pdf[col]) else ''
+    columns = list(fills)
+    filled = []
+    for pdf in pdfs:
+        missing = {col:fill for col,fill in fills.items() if col not in pdf}
+        if missing:
+            pdf = pdf.assign(**missing)
+        filled.append(pdf[columns])
+    df = pd.concat(filled, ignore_index=True, sort=False) if filled else pd.DataFrame()
+    for icol,col in enumerate(columns):
+        np.save(os.path.join(tdir, '{}.npy'.format(icol)), _column_array(df[col]))
+    with open(metafile, 'w') as f:
+        json.dump({'key': key, 'columns': columns, 'offsets': offsets.tolist()}, f)
+
+def load_table(name, key):
+    """
+    returns the saved table as a dataframe w/ the offsets where each player's rows start (and where the last one ends),
+    or None if there isn't one or it doesn't match the key.
+    """
+    metafile = os.path.join(_table_dir(name), 'meta.json')
+    if not os.path.isfile(metafile):
+        return None
+    try:
+        with open(metafile) as f:
+            meta = json.load(f)
+    except Exception as e:
+        logging.error('could not read {}: {}'.format(metafile, e))
+        return None
+    if meta['key'] != key:
+        logging.info('table {} is out of date'.format(name))
+        return None
+    data = {col:np.load(os.path.join(_table_dir(name), '{}.npy'.format(icol)), mmap_mode='r')
+            for icol,col in enumerate(meta['columns'])}
+    return pd.DataFrame(data, columns=meta['columns']), np.array(meta['offsets'])
+
+def split_table(df, offsets):
+    """
+    the list of each player's dataframe from a loaded table
+    """
+    return [df.iloc[start:end].reset_index(drop=True) for start,end in zip(offsets[:-1], offsets[1:])]
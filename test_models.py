@@ -2,7 +2,9 @@
 import dist_fit
 from get_player_stats import *
 from playermodels.positions import *
-from tools import corr_spearman
+from playermodels.replay import Careers, replay, total_kld_grad
+from table_store import sources_key, save_table, load_table, split_table
+from tools import corr_spearman_matrix, corr_source
 
 import numpy as np
 import pandas as pd
@@ -15,6 +17,7 @@ import warnings
 import os.path
 import argparse
 import random
+from multiprocessing import Pipe, Process
 
 def main():
     logging.getLogger().setLevel(logging.DEBUG)
@@ -30,6 +33,7 @@ def main():
     parser = argparse.ArgumentParser(description='optimize and analyze bayesian models')
     parser.add_argument('position',type=str,choices=['RB', 'QB', 'WR', 'TE'],help='which position to analyze')
     parser.add_argument('--opt-hyper',nargs='?',type=str,choices=all_models,help='try to improve hyperparameters for this model')
+    parser.add_argument('--jobs',type=int,default=1,help='number of processes to evaluate the hyperparameter objective with')
 
     args = parser.parse_args()
 
@@ -39,7 +43,7 @@ def main():
     if args.opt_hyper:
         # some of the learn rates may be too large because we only have weekly data back to 2009 right now.
         # this means we're missing most of the beginnings of careers, and are starting in the middle.
-        hps = find_model_hyperparameters(position, args.opt_hyper)
+        hps = find_model_hyperparameters(position, args.opt_hyper, jobs=args.jobs)
     
     posdf = get_model_df(position)
     posdf = posdf[posdf['game_num'] < 16]# .dropna() # don't necessarily remove nans
@@ -123,47 +127,13 @@ def main():
     plmodel = gen_player_model(position)
     stats = plmodel.stats
     print(stats)
-    corr_mat = np.ones(shape=(len(stats), len(stats)))
-    # for sa,sb in itertools.combinations(stats, 2):
-    for ia in range(len(stats)):
-        sa = stats[ia]
-        for ib in range(ia):
-            sb = stats[ib]
-            cdfs = (corrdf[sa+'_cdf'].values, corrdf[sb+'_cdf'].values)
-            # sr = st.spearmanr(*cdfs)
-            # rho,p = sr
-            # print('rho: {:.3f} \t p : {:.3g}'.format(rho, p))
-            # quantities that are "per" another quantity should be weighted by that quantity so the correlation is dominated by relevant data
-            weights = np.ones(shape=cdfs[0].shape)
-            cmpsts = set((sa, sb))
-            # we don't want to double-weight; for instance the correlation between
-            # rush_yds and rush_td should be weighted by a single power of rush_att
-            if len(cmpsts & set(['rush_yds', 'rush_td'])):
-                # print('weighting {},{} by rush attempts'.format(sa, sb))
-                weights *= corrdf['rush_att'].values
-                
-            if 'rec' in cmpsts:
-                # print('weighting {},{} by targets'.format(sa, sb))
-                weights *= corrdf['targets'].values
-            elif len(cmpsts & set(['rec_yds', 'rec_td'])):
-                # print('weighting {},{} by receptions'.format(sa, sb))
-                weights *= corrdf['rec'].values
-
-            if len(cmpsts & set(['pass_cmp', 'pass_int'])) > 0:
-                # print('weighting {},{} by pass attempts'.format(sa, sb))
-                weights *= corrdf['pass_att'].values
-            elif len(cmpsts & set(['pass_yds', 'pass_td'])) > 0:
-                # print('weighting {},{} by completions'.format(sa, sb))
-                weights *= corrdf['pass_cmp'].values
-                
-            corr_sp = corr_spearman(*cdfs, weights=weights)
-            corr_mat[ia,ib] = corr_mat[ib,ia] = corr_sp
-            # print('weighted spearman correlation of {} and {}:'.format(sb, sa))
-            # print('{:.3f}'.format(corr_sp))
-
-    # array2string lets us print out w/ commas for easy copy-paste
+    # the correlation of each pair is found w/ the weights relevant to it, leaving out the games where either cdf is missing
+    cdfs = corrdf[[s+'_cdf' for s in stats]].values
+    corr_mat = corr_spearman_matrix(cdfs, weights=lambda ia, ib: corr_weights(corrdf, stats[ia], stats[ib]))
+
+    # this is printed in the same form as the matrices in playermodels/positions.py, for easy copy-paste
     print('weighted covariance matrix for {} stats:'.format(position))
-    print(np.array2string(corr_mat, precision=3, separator=',', suppress_small=True))
+    print(corr_source('{}_CORR'.format(position), corr_mat))
         
     logging.warning('exiting early')
     exit(0)    
@@ -179,9 +149,46 @@ def main():
     return
 
 
+def _pos_sources(pos):
+    # the files that the tables for a position are made from
+    pfrids = get_pos_players(pos.upper())['pfr_id']
+    return ['data/players/index.csv'] + ['data/players/{}.csv'.format(pid) for pid in pfrids]
+
+def corr_weights(corrdf, sa, sb):
+    """
+    the weights of each game for the correlation between stats sa and sb.
+    quantities that are "per" another quantity should be weighted by that quantity so the correlation is dominated by relevant data
+    """
+    weights = np.ones(len(corrdf))
+    cmpsts = set((sa, sb))
+    # we don't want to double-weight; for instance the correlation between
+    # rush_yds and rush_td should be weighted by a single power of rush_att
+    if len(cmpsts & set(['rush_yds', 'rush_td'])):
+        weights *= corrdf['rush_att'].values
+        
+    if 'rec' in cmpsts:
+        weights *= corrdf['targets'].values
+    elif len(cmpsts & set(['rec_yds', 'rec_td'])):
+        weights *= corrdf['rec'].values
+
+    if len(cmpsts & set(['pass_cmp', 'pass_int'])) > 0:
+        weights *= corrdf['pass_att'].values
+    elif len(cmpsts & set(['pass_yds', 'pass_td'])) > 0:
+        weights *= corrdf['pass_cmp'].values
+    return weights
+
+
 def get_pos_dfs(pos, fname = None):
-    # this whole procedure can be done rather rapidly now, so there's no need to cache
+    # the games of every player are saved in a single table, so that they don't have to be read from each player's file.
+    # it is remade whenever any of the players' files change.
     pos = pos.upper()
+    sources = _pos_sources(pos)
+    tname = 'games_{}'.format(pos.lower())
+    if all(os.path.isfile(f) for f in sources):
+        table = load_table(tname, sources_key(sources))
+        if table is not None:
+            return split_table(*table)
+
     pldfs = []
 
     good_col = None
@@ -208,22 +215,16 @@ def get_pos_dfs(pos, fname = None):
         pdf = pdf.sort_values(['year', 'game_num']).reset_index(drop=True)
         pldfs.append(pdf)
 
+    # some players' files might not exist if they couldn't be scraped
+    if all(os.path.isfile(f) for f in sources):
+        save_table(tname, pldfs, sources_key(sources))
     return pldfs
 
 
-def get_model_df( pos='RB', fname = None):
-    if fname is None:
-        fname = 'model_cache_{}.csv'.format(pos.lower())
-    if os.path.isfile(fname):
-        return pd.read_csv(fname)
-
-    posdfs = get_pos_dfs(pos)
-
-    # basing rush attempts soley on the past is not so great.
-    # ideally we use a team-based touch model.
-    # we need to look into the discrepancies more to figure out the problems
-    # i suspect injuries, trades, then matchups are the big ones.
-
+def position_models(pos):
+    """
+    the names of the stat models that are checked for a position
+    """
     models = []
     if pos == 'QB':
         models.extend(['pass_att', 'pass_cmp', 'pass_yds', 'pass_td', 'pass_int'])
@@ -231,60 +232,129 @@ def get_model_df( pos='RB', fname = None):
         models.extend(['rush_att', 'rush_yds', 'rush_td'])
     if pos in ['WR', 'TE', 'RB']:
         models.extend(['targets', 'rec', 'rec_yds', 'rec_td'])
-    tot_week = 0
-    
-    for pdf in posdfs:
-        # pname = pdf['name'].unique()[0]
-        # pname = pdf['player'].unique()[0]
-        
-        pid = pdf['pfr_id'].unique()[0]
-        plmodels = [get_stat_model(mod).for_position(pos) for mod in models]
+    return models
+
+def get_model_df( pos='RB', name = None):
+    """
+    each player's games w/ the ev, cdf, kld, and chi^2 of every model before it learns from each game.
+    the result is saved as a table that is remade if the players' files or the models' hyperparameters change.
+    """
+    if name is None:
+        name = 'model_{}'.format(pos.lower())
 
-        # insert zeros for stats that aren't saved for this player
-        for var in np.concatenate([plmodel.var_names for plmodel in plmodels]):
+    # basing rush attempts soley on the past is not so great.
+    # ideally we use a team-based touch model.
+    # we need to look into the discrepancies more to figure out the problems
+    # i suspect injuries, trades, then matchups are the big ones.
+    models = position_models(pos)
+
+    sources = _pos_sources(pos)
+    key = None
+    if all(os.path.isfile(f) for f in sources):
+        # lists of floats have an exact repr, unlike numpy arrays
+        hpars = [(mod, np.asarray(get_stat_model(mod)._default_hyperpars(pos), dtype=float).tolist()) for mod in models]
+        key = sources_key(sources, hpars)
+        table = load_table(name, key)
+        if table is not None:
+            return table[0]
+
+    posdfs = get_pos_dfs(pos)
+
+    # insert zeros for stats that aren't saved for some players
+    plmodels = [get_stat_model(mod).for_position(pos) for mod in models]
+    var_names = list(dict.fromkeys(var for plmodel in plmodels for var in plmodel.var_names))
+    for pdf in posdfs:
+        for var in var_names:
             if var not in pdf:
                 pdf[var] = 0
 
+    # each model is run through every career at once, giving the state before each game.
+    # the diagnostics are then found for all the games together, in the same (flattened) order as the careers.
+    careers = Careers(posdfs, var_names, max_game=16) # week 17 is often funky
+    cols = {}
+    for model in plmodels:
+        history = replay(model, careers)
+        model.set_state(history[:,careers.mask])
+        mvars = careers.games(model.var_names)
+        depvars = mvars[1:]
+        cols['{}_ev'.format(model.name)] = np.broadcast_to(model.ev(*depvars), careers.mask.sum())
+        cols['{}_cdf'.format(model.name)] = model.cdf(*mvars) # standardized to look like a gaussian
+        cols['{}_kld'.format(model.name)] = model.kld(*mvars)
+        cols['{}_chisq'.format(model.name)] = model.chi_sq(*mvars)
+
+    # split the results back into each player's games. the games after week 16 are left empty.
+    ends = np.cumsum(careers.mask.sum(axis=1))
+    for pdf,start,end in zip(posdfs, np.concatenate([[0], ends[:-1]]), ends):
+        kept = np.flatnonzero(pdf['game_num'].values < 16)
         years = pdf['year'].unique()
-        # we could skip single-year seasons
-        for icareer,year in enumerate(years):
-            # can we use "group by" or something to reduce the depth of these loops?
-            ypdf = pdf[(pdf['year'] == year) & (pdf['game_num'] < 16)] # week 17 is often funky
-            for index, row in ypdf.iterrows():
-                # these do point to the same one:
-                # assert((row[['name', 'year', 'week']] == rbdf.loc[index][['name', 'year', 'week']]).all())
-                tot_week += 1
-                pdf.loc[index,'career_year'] = icareer+1
-                for model in plmodels:
-                    try:
-                        mvars = [row[v] for v in model.var_names]
-                    except:
-                        print(row)
-                        print (model.var_names)
-                    kld = model.kld(*mvars)
-                    chisq = model.chi_sq(*mvars)
-                    data = row[model.pred_var]
-                    depvars = [row[v] for v in model.dep_vars]
-                    ev = model.ev(*depvars)
-                    var = model.var(*depvars)
-                    cdf = model.cdf(*mvars) # standardized to look like a gaussian
-                    # if row[model.pred_var] == 0:
-                    #     cdf = random.uniform(0,cdf) # smear the cdf to deal with small discrete numbers
-                    # res = (data-ev)/np.sqrt(var)
-                    pdf.loc[index,'{}_ev'.format(model.name)] = ev
-                    pdf.loc[index,'{}_cdf'.format(model.name)] = cdf
-                    pdf.loc[index,'{}_kld'.format(model.name)] = kld
-                    pdf.loc[index,'{}_chisq'.format(model.name)] = chisq
-                    model.update_game(*mvars) # it's important that this is done last, after computing KLD and chi^2
-            for model in plmodels:
-                model.new_season()
-                
-    combdf = pd.concat(posdfs, sort=False)
-    combdf.to_csv(fname)
-    return combdf
-
-
-def find_model_hyperparameters(pos, model_name='rush_att'):
+        career_year = np.full(len(pdf), np.nan)
+        career_year[kept] = np.searchsorted(years, pdf['year'].values[kept]) + 1
+        pdf['career_year'] = career_year
+        for col,vals in cols.items():
+            pcol = np.full(len(pdf), np.nan)
+            pcol[kept] = vals[start:end]
+            pdf[col] = pcol
+
+    if key is None:
+        return pd.concat(posdfs, ignore_index=True, sort=False)
+    save_table(name, posdfs, key)
+    return load_table(name, key)[0]
+
+
+# each worker process of the hyperparameter search holds only its own chunk of the careers.
+# the chunk is given once when the worker starts, so each evaluation only has to send the hyperparameters.
+def _kld_worker(conn, mdtype, careers):
+    # evaluate the KLD and its gradient for each set of hyperparameters received, until None is sent
+    while True:
+        hparams = conn.recv()
+        if hparams is None:
+            break
+        try:
+            conn.send(total_kld_grad(mdtype(*hparams), careers))
+        except Exception as e:
+            conn.send(e)
+    conn.close()
+
+class _KldWorkers:
+    """
+    a process for each chunk of the careers, which sums the KLD over all of them.
+    """
+    def __init__(self, mdtype, chunks):
+        self.conns = []
+        self.procs = []
+        for careers in chunks:
+            conn,child_conn = Pipe()
+            proc = Process(target=_kld_worker, args=(child_conn, mdtype, careers), daemon=True)
+            proc.start()
+            child_conn.close()
+            self.conns.append(conn)
+            self.procs.append(proc)
+
+    def __call__(self, hparams):
+        for conn in self.conns:
+            conn.send(hparams)
+        results = [conn.recv() for conn in self.conns]
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+        return sum(r[0] for r in results), sum(r[1] for r in results)
+
+    def shutdown(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass # the worker already exited
+        for proc in self.procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+
+
+def find_model_hyperparameters(pos, model_name='rush_att', jobs=1):
+    """
+    jobs: if > 1, the players are split into this many chunks whose KLDs are summed in parallel processes
+    """
     logging.info('will search for good hyperparameters for {}'.format(model_name))
     posdfs = get_pos_dfs(pos)
 
@@ -295,60 +365,41 @@ def find_model_hyperparameters(pos, model_name='rush_att'):
     
     assert(len(hpars0) == len(hparbounds))
 
+    # the careers are padded into arrays once, and each evaluation runs every player through them at once.
+    # in parallel, the players are dealt out into a chunk per process.
+    var_names = mdtype(*hpars0).var_names
+    chunks = [Careers(posdfs[i::jobs], var_names, max_game=16) for i in range(jobs)] # week 17 is often funky
+    workers = _KldWorkers(mdtype, chunks) if jobs > 1 else None
+
     newmin = np.inf
     
+    # the gradient is found along w/ the KLD, so the optimizer doesn't need to take finite differences
     def tot_kld(hparams):
         nonlocal newmin
-        tot_kld = 0
-        for pdf in posdfs:
-            plmodel = mdtype(*hparams)
-            for var in plmodel.var_names:
-                if var not in pdf:
-                    pdf[var] = 0
-            years = pdf['year'].unique()
-            assert((np.diff(years) > 0).all()) # make sure the years are sorted
-            # we could skip single-year seasons
-            for icareer,year in enumerate(years):
-                # can we use "group by" or something to reduce the depth of these loops?
-                # ypdf = pdf[(pdf['year'] == year) & (pdf['week'] < 17)] # week 17 is often funky
-                ypdf = pdf[(pdf['year'] == year) & (pdf['game_num'] < 16)] # week 17 is often funky
-                for index, row in ypdf.iterrows():
-                    # print(plmodel.var_names)
-                    # print(row)
-                    # print(row['targets'])
-                    try:
-                        mvars = [row[v] for v in plmodel.var_names]
-                    except:
-                        logging.error('missing some of {}'.format(plmodel.var_names))
-                        print(row)
-                        exit(1)
-                    # if plmodel.name == 'rec':
-                    #     if row['rec'] > row['targets']:
-                    #         print(row)
-                    kld = plmodel.kld(*mvars)
-                    # if np.isnan(kld):
-                    #     print(plmodel.var_names)
-                    #     print(mvars)
-                    #     exit(1)
-                    tot_kld += kld
-                    # it's important that updating is done after computing KLD
-                    plmodel.update_game(*mvars)
-                plmodel.new_season()
+        if workers is None:
+            tot_kld,grad = total_kld_grad(mdtype(*hparams), chunks[0])
+        else:
+            tot_kld,grad = workers(hparams)
         if tot_kld < newmin:
             newmin = tot_kld
             print('kld = {} at {}'.format(tot_kld, hparams))
         if not np.isfinite(tot_kld):
             print('kld = {} at {}'.format(tot_kld, hparams))
-        return tot_kld
-
-    minned = opt.minimize(tot_kld, x0=hpars0,
-                          # method='Nelder-Mead', # N-M can't deal w/ bounds
-                          bounds=hparbounds,
-                          # it'll take several iterations to start going in the right direction w/ the default algorithm
-                          # tho there are several function calls per "iteration" w/ default
-                          options={'maxiter':32,
-                                   # 'ftol':1e-12 # seems like a waste
-                          })
+        return tot_kld,grad
+
+    try:
+        minned = opt.minimize(tot_kld, x0=hpars0, jac=True,
+                              # method='Nelder-Mead', # N-M can't deal w/ bounds
+                              bounds=hparbounds,
+                              # it'll take several iterations to start going in the right direction w/ the default algorithm
+                              # tho there are several function calls per "iteration" w/ default
+                              options={'maxiter':32,
+                                       # 'ftol':1e-12 # seems like a waste
+                              })
+    finally:
+        # don't leave the workers running if the search fails
+        if workers is not None:
+            workers.shutdown()
     print(minned)
     minpars = minned.x
     print(mdtype(*minpars))
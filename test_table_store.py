@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+import table_store
+from table_store import save_table, load_table, split_table
+
+def test_nan_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(table_store, 'tables_dir', str(tmp_path))
+    pdfs = [pd.DataFrame({'game_num': [1, 16], 'rush_att': [12, 0], 'rush_att_kld': [0.5, np.nan]}),
+            pd.DataFrame({'game_num': [3], 'rec': [4], 'rush_att_kld': [np.nan]})]
+    save_table('games', pdfs, 'key')
+    df, offsets = load_table('games', 'key')
+    assert list(offsets) == [0, 2, 3]
+    # real missing values are kept, while stats a player doesn't have are zero
+    assert np.isnan(df['rush_att_kld'].values).tolist() == [False, True, True]
+    assert df['rec'].tolist() == [0, 0, 4]
+    assert df['rush_att'].dtype.kind == 'i'
+    first = split_table(df, offsets)[0]
+    assert first['rush_att_kld'][0] == 0.5
+    assert load_table('games', 'other key') is None
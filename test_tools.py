@@ -0,0 +1,17 @@
+import numpy as np
+
+from tools import corr_spearman, corr_spearman_matrix
+
+def test_spearman_matrix_drops_nans_per_pair():
+    rng = np.random.default_rng(3490)
+    data = rng.standard_normal((64, 4))
+    data[:,1] += data[:,0]
+    data[rng.random(64) < 0.3, 2] = np.nan # a sparse column shouldn't change the pairs it isn't in
+    weights = rng.random(64)
+    for wts in [None, weights, lambda ia, ib: weights]:
+        corr = corr_spearman_matrix(data, wts)
+        for ia in range(4):
+            for ib in range(ia):
+                pwts = wts(ia, ib) if callable(wts) else wts
+                assert np.isclose(corr[ia,ib], corr_spearman(data[:,ia], data[:,ib], pwts))
+                assert corr[ib,ia] == corr[ia,ib]
@@ -1,58 +1,33 @@
 # some helper functions
+import os
+import subprocess
 import numpy as np
 
-def corr_spearman(x, y, weights=None):
+def git_commit():
     """
-    calculates the spearman rank coefficient between arrays, using weights.
-    this version runs in linearithmic time (the naive n^2 is quite slow)
-    it might also be a candidate for Cython.
+    the commit of the code that is running, to record alongside results. None if it isn't in a git repository.
     """
-    assert(len(x) == len(y))
-    mask = ~(np.isnan(x) | np.isnan(y))
-    xvals = x[mask]
-    yvals = y[mask]
-    wts = weights[mask] if weights is not None else np.ones(xvals.shape)
-    xsort = np.sort(xvals)
-    ysort = np.sort(yvals)
-
-    # keeping the indices will be useful for labelling with the ranks
-    xargsorted = np.argsort(xvals)
-    yargsorted = np.argsort(yvals)
-
-    xrank = np.empty(xsort.shape)
-    yrank = np.empty(ysort.shape)
-
-    # # for testing:
-    # xrank[:] = np.nan
-    # yrank[:] = np.nan
-    
-    i=0
-    while i < len(xsort):
-        val = xsort[i]
-        j = i+1
-        while j < len(xsort) and xsort[j] == val:
-            j += 1
-        # if there are duplicate values, set the rank of all of them to half
-        rk = 0.5*(i+j)
-        for ix in xargsorted[i:j]:
-            xrank[ix] = rk
-        i = j
-
-    i=0
-    while i < len(ysort):
-        val=ysort[i]
-        j = i+1
-        while j < len(ysort) and ysort[j] == ysort[i]:
-            j += 1
-        # if there are duplicate values, set the rank of all of them to half
-        rk = 0.5*(i+j)
-        for iy in yargsorted[i:j]:
-            yrank[iy] = rk
-        i = j
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
 
-    # assert(not np.isnan(xrank).any())
-    # assert(not np.isnan(yrank).any())
+def rank_columns(data):
+    """
+    the rank of each value in each column of a 2-d array.
+    tied values are all given their average rank, which is shifted by one half from the usual 1-based convention.
+    """
+    data = np.asarray(data, dtype=float)
+    ranks = np.empty(data.shape)
+    for icol,col in enumerate(data.T):
+        # the unique values are sorted, so the tied values of each one fill the positions from end-count to end.
+        _,inv,counts = np.unique(col, return_inverse=True, return_counts=True)
+        ends = np.cumsum(counts)
+        ranks[:,icol] = (ends - 0.5*counts)[inv.reshape(-1)]
+    return ranks
 
+def _weighted_corr(xrank, yrank, weights=None):
     # compute the weighted means of the ranks
     xmrk = np.average(xrank, weights=weights)
     ymrk = np.average(yrank, weights=weights)
@@ -64,6 +39,67 @@ def corr_spearman(x, y, weights=None):
     result = xycorrrk / np.sqrt(xvarrk*yvarrk)
     return result
 
+def corr_spearman(x, y, weights=None):
+    """
+    calculates the spearman rank coefficient between arrays, using weights.
+    this version runs in linearithmic time (the naive n^2 is quite slow)
+    """
+    assert(len(x) == len(y))
+    mask = ~(np.isnan(x) | np.isnan(y))
+    wts = np.asarray(weights)[mask] if weights is not None else None
+    ranks = rank_columns(np.column_stack((x[mask], y[mask])))
+    return _weighted_corr(ranks[:,0], ranks[:,1], wts)
+
+def corr_spearman_matrix(data, weights=None):
+    """
+    the weighted spearman rank correlation between every pair of columns of data (w/ shape (n, ncols)).
+    as in corr_spearman, the rows w/ a nan in either column of a pair are left out of that pair.
+    the columns w/out any nans are ranked once and shared by all their pairs; only the pairs w/ a column that has nans
+    are ranked separately.
+    weights: an array of n weights to use for every pair, or a function of the pair of column indices (i, j)
+      that returns the weights for that pair (e.g. to weight each pair by the attempts relevant to it).
+    """
+    data = np.asarray(data, dtype=float)
+    ncols = data.shape[1]
+    full = ~np.isnan(data).any(axis=0)
+    ranks = np.full(data.shape, np.nan)
+    ranks[:,full] = rank_columns(data[:,full])
+    corr = np.eye(ncols)
+    for ia in range(ncols):
+        for ib in range(ia):
+            if full[ia] and full[ib] and not callable(weights):
+                continue # these are all found at once below
+            wts = weights(ia, ib) if callable(weights) else weights
+            if full[ia] and full[ib]:
+                corr[ia,ib] = _weighted_corr(ranks[:,ia], ranks[:,ib], np.asarray(wts, dtype=float))
+            else:
+                corr[ia,ib] = corr_spearman(data[:,ia], data[:,ib], wts)
+            corr[ib,ia] = corr[ia,ib]
+    if callable(weights) or full.sum() < 2:
+        return corr
+    # w/ the same weights for every pair, all the correlations between full columns come from one weighted covariance of the ranks
+    franks = ranks[:,full]
+    wts = np.ones(len(franks)) if weights is None else np.asarray(weights, dtype=float)
+    wts = wts / wts.sum()
+    dev = franks - wts @ franks
+    cov = dev.T @ (wts[:,np.newaxis]*dev)
+    sd = np.sqrt(np.diag(cov))
+    fcorr = cov / np.outer(sd, sd)
+    # the products aren't exactly symmetric after rounding, but the matrix needs to be for its cholesky factor
+    fcorr = 0.5*(fcorr + fcorr.T)
+    np.fill_diagonal(fcorr, 1.)
+    corr[np.ix_(full, full)] = fcorr
+    return corr
+
+def corr_source(name, corr):
+    """
+    a correlation matrix as python source, in the same form as the constants in playermodels/positions.py,
+    so that it can be pasted in after the models are retuned.
+    """
+    # adding zero turns any -0 from rounding into 0
+    corrstr = np.array2string(np.round(corr, 3) + 0., precision=3, separator=',', suppress_small=True, max_line_width=200)
+    return '{} = np.array(\n    {})'.format(name, corrstr.replace('\n', '\n    '))
+
 
 def get_k_partition_boundaries(data, k):
     if k >= len(data):
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# retune the hyperparameters of every stat model at every position in one run.
+# each model is fit on k-1 folds of the players and scored on the held-out fold, and then fit once more on all the players.
+# the full fit is kept if its cross-validated KLD beats the current hyperparameters', and the results are saved
+# as a new version of the hyperparameter registry that the models load.
+import argparse
+import datetime
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import scipy.optimize as opt
+
+from playermodels.positions import get_stat_model
+from playermodels.replay import Careers, total_kld, total_kld_grad
+from playermodels.hyperpars import registry_file, save_registry
+from test_models import get_pos_dfs, position_models
+from tools import git_commit
+
+checkpoint_dir = 'data/tune'
+
+def _checkpoint_file(pos, model_name, fold):
+    return os.path.join(checkpoint_dir, '{}_{}_{}.json'.format(pos.lower(), model_name, 'all' if fold is None else fold))
+
+def _save_checkpoint(fname, entry):
+    # write to a temporary file first so that a crash can't leave a corrupted checkpoint
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(entry, f)
+    os.replace(fname + '.tmp', fname)
+
+def fold_careers(pos, var_names, fold, nfolds, seed):
+    """
+    the training and held-out careers for a fold. the players are shuffled into folds w/ the seed.
+    if fold is None, all the players are used for training and there are no held-out careers.
+    """
+    posdfs = get_pos_dfs(pos)
+    folds = np.random.default_rng(seed).permutation(len(posdfs)) % nfolds
+    if fold is None:
+        return Careers(posdfs, var_names, max_game=16), None
+    train = [pdf for pdf,f in zip(posdfs, folds) if f != fold]
+    test = [pdf for pdf,f in zip(posdfs, folds) if f == fold]
+    return Careers(train, var_names, max_game=16), Careers(test, var_names, max_game=16) # week 17 is often funky
+
+def tune_task(pos, model_name, fold, nfolds, seed, maxiter, restart=False):
+    """
+    fit the hyperparameters of one model on the training players of a fold (or all of them, if fold is None).
+    the optimizer's position is saved after every iteration, so an interrupted fit continues from where it was.
+    only the position and the iteration count are saved, not the optimizer's curvature history,
+    so a resumed fit is a warm start from the saved point rather than an exact continuation of the interrupted one.
+    returns a dictionary of the fit and the held-out KLD of both the fit and the starting hyperparameters.
+    """
+    mdtype = get_stat_model(model_name)
+    hpars0 = np.asarray(mdtype._default_hyperpars(pos), dtype=float)
+    config = {'pos': pos, 'model': model_name, 'fold': fold, 'nfolds': nfolds, 'seed': seed,
+              'maxiter': maxiter, 'hyperpars0': hpars0.tolist()}
+    ckfile = _checkpoint_file(pos, model_name, fold)
+    entry = {'config': config, 'x': hpars0.tolist(), 'nit': 0, 'done': False}
+    if not restart and os.path.isfile(ckfile):
+        with open(ckfile) as f:
+            saved = json.load(f)
+        if saved['config'] == config:
+            entry = saved
+            if entry['done']:
+                return entry
+        else:
+            logging.info('the settings have changed since {} was saved. starting over.'.format(ckfile))
+
+    train,test = fold_careers(pos, mdtype(*hpars0).var_names, fold, nfolds, seed)
+
+    def callback(xk):
+        entry['x'] = np.asarray(xk).tolist()
+        entry['nit'] += 1
+        _save_checkpoint(ckfile, entry)
+
+    if entry['nit'] < maxiter:
+        minned = opt.minimize(lambda hpars: total_kld_grad(mdtype(*hpars), train),
+                              x0=np.array(entry['x']), jac=True, bounds=mdtype._hyperpar_bounds(),
+                              options={'maxiter': maxiter - entry['nit']}, callback=callback)
+        entry['x'] = minned.x.tolist()
+        entry['message'] = str(minned.message)
+    entry['train_kld'] = float(total_kld(mdtype(*entry['x']), train))
+    entry['train_games'] = int(train.mask.sum())
+    if test is not None:
+        entry['test_kld'] = float(total_kld(mdtype(*entry['x']), test))
+        entry['test_kld0'] = float(total_kld(mdtype(*hpars0), test))
+        entry['test_games'] = int(test.mask.sum())
+    entry['done'] = True
+    _save_checkpoint(ckfile, entry)
+    return entry
+
+
+def select_hyperpars(entries, nfolds):
+    """
+    the hyperparameters to save for each position and model, from the finished fits.
+    the fit on all players is only kept if the fits on the folds beat the current hyperparameters on the held-out players.
+    """
+    selected = {}
+    for (pos,model_name),mentries in sorted(entries.items()):
+        folds = [mentries[fold] for fold in range(nfolds)]
+        cv_kld = sum(e['test_kld'] for e in folds)
+        cv_kld0 = sum(e['test_kld0'] for e in folds)
+        ngames = sum(e['test_games'] for e in folds)
+        logging.info('{} {}: cross-validated kld per game = {:.5f} (was {:.5f})'
+                     .format(pos, model_name, cv_kld/ngames, cv_kld0/ngames))
+        if not cv_kld < cv_kld0:
+            logging.info('keeping the current hyperparameters for {} {}'.format(pos, model_name))
+            continue
+        selected.setdefault(model_name, {})[pos] = {
+            'hyperpars': mentries[None]['x'],
+            'cv_kld': cv_kld/ngames,
+            'cv_kld_previous': cv_kld0/ngames,
+            'train_kld': mentries[None]['train_kld']/mentries[None]['train_games'],
+        }
+    return selected
+
+
+def main():
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(description='retune the hyperparameters of the stat models w/ cross-validation')
+    parser.add_argument('positions', type=str, nargs='*', default=['QB', 'RB', 'WR', 'TE'], help='which positions to tune')
+    parser.add_argument('--models', type=str, nargs='+', default=None, help='only tune these models (all by default)')
+    parser.add_argument('--folds', type=int, default=5, help='number of folds to split the players into')
+    parser.add_argument('--maxiter', type=int, default=64, help='maximum number of optimizer iterations for each fit')
+    parser.add_argument('--seed', type=int, default=3490, help='seed for shuffling players into folds')
+    parser.add_argument('--jobs', type=int, default=1, help='number of fits to run at once in separate processes')
+    parser.add_argument('--restart', action='store_true', help='ignore saved checkpoints and start every fit over. '
+                        'otherwise interrupted fits are warm-started from their last saved point (the optimizer\'s history is not kept)')
+    parser.add_argument('--output', type=str, default=registry_file, help='registry file to save the tuned hyperparameters to')
+    args = parser.parse_args()
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    tasks = []
+    for pos in args.positions:
+        # make sure each position's table of games exists before the workers try to read it
+        get_pos_dfs(pos)
+        for model_name in position_models(pos):
+            if args.models is None or model_name in args.models:
+                tasks.extend([(pos, model_name, fold) for fold in list(range(args.folds)) + [None]])
+    logging.info('running {} fits'.format(len(tasks)))
+
+    entries = {}
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(tune_task, pos, model_name, fold, args.folds, args.seed, args.maxiter, args.restart):
+                   (pos, model_name, fold) for pos,model_name,fold in tasks}
+        for future in as_completed(futures):
+            pos,model_name,fold = futures[future]
+            entry = future.result()
+            entries.setdefault((pos, model_name), {})[fold] = entry
+            logging.info('finished {} {} on {}'.format(pos, model_name, 'all players' if fold is None else 'fold {}'.format(fold)))
+
+    selected = select_hyperpars(entries, args.folds)
+    tuning = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': {'folds': args.folds, 'maxiter': args.maxiter, 'seed': args.seed},
+        'results': {model_name:{pos:{k:v for k,v in res.items() if k != 'hyperpars'} for pos,res in poss.items()}
+                    for model_name,poss in selected.items()},
+    }
+    models = {model_name:{pos:res['hyperpars'] for pos,res in poss.items()} for model_name,poss in selected.items()}
+    version = save_registry(models, args.output, tuning=tuning)
+    if version is not None:
+        logging.info('saved version {} of the hyperparameters to {}'.format(version, args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+from run_projections import *
+
+# after a week of games, update the saved simulations for only the players that have new games.
+# the saved model states are loaded and just the new games are learned from, so this is much faster than a full run.
+# the player stats in data/players/ need to be updated first.
+# the players are simulated w/ the same options as the run that made the output, which run_projections.py records.
+
+def update_position(pos, current_year, sim_player, rsnames, jobs=1, corr_prior_games=None):
+    """
+    re-simulate the players at a position whose stats have changed since their models were saved,
+    and rewrite their rows of the simulation output of each ruleset.
+    returns the number of players updated.
+    corr_prior_games: must match the option sim_player was made with, to find the right saved models
+    """
+    fnames = {rsname:sim_output_file(pos, current_year, rsname) for rsname in rsnames}
+    for fname in fnames.values():
+        if not os.path.isfile(fname):
+            logging.error('no simulations found in {}. run run_projections.py for {}s first.'.format(fname, pos))
+            return 0
+
+    exprojs,prows,psuss,pseeds = get_player_inputs(pos, current_year)
+    pmod = gen_player_model(pos, corr_prior_games=corr_prior_games)
+    # rookies w/out a history have nothing new to learn from
+    changed = [i for i,prow in enumerate(prows)
+               if prow is not None and not model_is_current(prow['pfr_id'], pmod)]
+    logging.info('{} {}s have new games'.format(len(changed), pos))
+    if len(changed) == 0:
+        return 0
+
+    pick = lambda lst: [lst[i] for i in changed]
+    evdats = list(map_players(sim_player, pick(exprojs), pick(prows), pick(psuss), pick(pseeds), jobs=jobs))
+
+    # keep the original order of players (the expert ranking)
+    order = {exproj['player']:i for i,exproj in enumerate(exprojs)}
+    for rsname,fname in fnames.items():
+        # round_trip keeps the unchanged rows exactly as they were
+        evdf = pd.read_csv(fname, float_precision='round_trip')
+        for evdat in evdats:
+            pix = evdf['player'] == evdat[rsname]['player']
+            newrow = pd.DataFrame([evdat[rsname]])
+            if pix.any():
+                evdf = pd.concat([evdf[~pix], newrow], sort=False)
+            else:
+                evdf = pd.concat([evdf, newrow], sort=False)
+        evdf['order'] = evdf['player'].map(order)
+        evdf = evdf.sort_values('order').drop('order', axis=1).reset_index(drop=True)
+        # write to a temporary file first so that the old results aren't lost if something goes wrong
+        evdf.to_csv(fname + '.tmp', index=False)
+        os.replace(fname + '.tmp', fname)
+    return len(evdats)
+
+
+def main():
+    logging.getLogger().setLevel(logging.INFO)
+    np.set_printoptions(precision=4)
+    pd.options.display.precision = 2 # default is 6
+
+    parser = argparse.ArgumentParser(description='update simulations for players with new games')
+    parser.add_argument('positions', type=str, nargs='*', default=['QB', 'RB', 'WR', 'TE'], help='which positions to update')
+    parser.add_argument('--ruleset', type=str, nargs='+', choices=['phys', 'dude', 'bro', 'nycfc', 'ram'],
+                        default=['phys'], help='which rulesets to update the outputs of')
+    parser.add_argument('--year',nargs='?', type=int, default=2018, help='what is the current year')
+    parser.add_argument('--jobs', type=int, default=1, help='number of processes to train and simulate players with')
+    args = parser.parse_args()
+
+    for pos in args.positions:
+        if pos not in ['QB', 'RB', 'WR', 'TE']:
+            logging.error('no models for position {}'.format(pos))
+            continue
+        rules = {rsname:rulesets[rsname] for rsname in args.ruleset}
+        # every output that is rewritten needs to have been made w/ the same options
+        optfnames = [sim_options_file(pos, args.year, rsname) for rsname in rules]
+        alloptions = [load_sim_options(optfname) for optfname in optfnames]
+        if any(options is None for options in alloptions):
+            logging.error('the options of the simulations of {}s were not recorded. run run_projections.py for them again.'.format(pos))
+            continue
+        if any(options != alloptions[0] for options in alloptions[1:]):
+            logging.error('the simulations of {}s for {} were made w/ different options. update them separately.'
+                          .format(pos, ', '.join(rules)))
+            continue
+        options = alloptions[0]
+        sim_player = partial(simulate_player, pos=pos, rules=rules, hyperpars=gen_player_model(pos).hyperpars(), **options)
+        nupdated = update_position(pos, args.year, sim_player, list(rules), jobs=args.jobs,
+                                   corr_prior_games=options['corr_prior_games'])
+        logging.info('updated {} {}s'.format(nupdated, pos))
+
+if __name__ == '__main__':
+    main()